@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+""" Measure the memory taken by metadata `Value` lists
+
+    python benchmarks/metadata_memory.py [rows]
+
+Builds a `Value.list` from rows shaped like a Report.GetElements response
+and reports the memory allocated for the rows, for the list and for the
+values once they have all been created. Requires Python 3.4+ for tracemalloc.
+"""
+from __future__ import print_function
+
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from omniture.elements import Value  # noqa: E402
+
+
+def rows(count):
+    return [
+        {
+            "id": "evar{0}".format(i),
+            "name": "Custom Conversion {0}".format(i),
+            "type": "string",
+            "classifications": [],
+        }
+        for i in range(count)
+    ]
+
+
+def measure(function, *args):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = function(*args)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    return result, size
+
+
+def main(count=5000):
+    data, rows_size = measure(rows, count)
+    values, lazy_size = measure(
+        Value.list, 'elements', data, None, 'name', 'id')
+    values, values_size = measure(values.materialize)
+    print("{0} rows: {1:.0f} KiB".format(count, rows_size / 1024.0))
+    print("Value.list: {0:.0f} KiB".format(lazy_size / 1024.0))
+    print("every value created: {0:.0f} KiB more ({1:.0f} bytes per value)"
+          .format(values_size / 1024.0, values_size / float(count)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
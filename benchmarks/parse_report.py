@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+""" Time parsing a large ranked report with a breakdown
+
+    python benchmarks/parse_report.py [top rows] [rows per breakdown] [trended]
+
+Builds a response shaped like Report.Get for two elements and two metrics
+and times building `Report.columns`, `Report.data` and `Report.dataframe`
+from it. With trended set to 1 the top rows are hourly periods instead.
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from omniture.reports import Report  # noqa: E402
+
+
+class Query(object):
+    suite = None
+
+
+def period(hour):
+    day, hour = divmod(hour, 24)
+    return {'name': 'Day {0}'.format(day), 'year': 2016,
+            'month': 1 + day // 28, 'day': 1 + day % 28, 'hour': hour}
+
+
+def response(top, breakdown, trended=False):
+    if trended:
+        elements = [{'id': 'evar1', 'name': 'Campaign'}]
+        rows = [period(i) for i in range(top)]
+    else:
+        elements = [{'id': 'page', 'name': 'Page'},
+                    {'id': 'evar1', 'name': 'Campaign'}]
+        rows = [{'name': 'page{0}'.format(i)} for i in range(top)]
+    return {'report': {
+        'type': 'trended' if trended else 'ranked',
+        'period': 'Sep. 2016',
+        'elements': elements,
+        'metrics': [
+            {'id': 'pageviews', 'name': 'Page Views', 'decimals': 0},
+            {'id': 'bouncerate', 'name': 'Bounce Rate', 'decimals': 2},
+        ],
+        'data': [
+            dict(row, counts=['10', '0.5'], breakdown=[
+                {'name': 'campaign{0}'.format(j), 'counts': ['1', '0.25']}
+                for j in range(breakdown)])
+            for row in rows
+        ],
+    }}
+
+
+def timed(label, function):
+    start = time.time()
+    result = function()
+    print("{0}: {1:.2f}s".format(label, time.time() - start))
+    return result
+
+
+def main(top=1000, breakdown=500, trended=0):
+    raw = response(top, breakdown, trended)
+    print("{0} rows".format(top * breakdown))
+    timed("columns", lambda: Report(raw, Query()).columns)
+    timed("data", lambda: Report(raw, Query()).data)
+    timed("dataframe", lambda: Report(raw, Query()).dataframe)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -7,36 +7,44 @@ import logging.config
 import io
 
 from .account import Account
-from .utils import affix
+from .scheduler import as_completed
+from .throttle import QueueFullError
+from .utils import credentials
 
 
 def authenticate(username, secret=None, endpoint=Account.DEFAULT_ENDPOINT,
-                 prefix='', suffix=''):
-    """ Authenticate to the Adobe API using WSSE """
+                 prefix='', suffix='', **kwargs):
+    """ Authenticate to the Adobe API using WSSE
+
+    Any additional keyword arguments are passed on to `Account`.
+    """
     # setup logging
     setup_logging()
     # if no secret is specified, we will assume that instead
     # we have received a dictionary with credentials (such as
     # from os.environ)
-    if not secret:
-        source = username
-        key_to_username = affix(prefix, 'OMNITURE_USERNAME', suffix)
-        key_to_secret = affix(prefix, 'OMNITURE_SECRET', suffix)
-        username = source[key_to_username]
-        secret = source[key_to_secret]
+    username, secret = credentials(username, secret, prefix, suffix)
 
-    return Account(username, secret, endpoint)
+    return Account(username, secret, endpoint, **kwargs)
 
 
 def queue(queries):
+    """ Queue a number of reports without waiting for them
+
+    Reports that don't fit in their account's queue (see `max_queued`)
+    are left alone, `omniture.sync` queues them once there is room.
+    """
     if isinstance(queries, dict):
         queries = queries.values()
 
     for query in queries:
-        query.queue()
+        try:
+            query.queue(block=False)
+        except QueueFullError:
+            pass
 
 
-def sync(queries, heartbeat=None, interval=1):
+def sync(queries, heartbeat=None, interval=1, bulk=False):
     """
     `omniture.sync` will queue a number of reports and then
     block until the results are all ready.
@@ -51,28 +59,28 @@ def sync(queries, heartbeat=None, interval=1):
         omniture.queue(query)
         omniture.sync(query)
 
-    The interval will operate under an exponetial decay until it reaches 5
-    minutes. At which point it will ping every 5 minutes
-    """
+    All pending reports are polled together, each with its own interval,
+    so the time spent waiting is close to that of the slowest report
+    rather than the sum of all of them. Use `omniture.as_completed` to
+    work with the reports as they come in.
 
-    queue(queries)
+    With `bulk=True` the status of all pending reports is checked with a
+    single `Report.GetQueue` call per account, and reports are only
+    fetched once they have left the queue.
+
+    The interval will operate under an exponetial decay until it reaches
+    30 seconds. At which point it will ping every 30 seconds
+    """
+    results = as_completed(queries, heartbeat, interval, bulk)
 
     if isinstance(queries, list):
-        return [query.sync(heartbeat, interval) for query in queries]
-    elif isinstance(queries, dict):
-        return {
-            key: query.sync(
-                heartbeat,
-                interval
-            ) for key, query in queries.items()
-        }
+        reports = [None] * len(queries)
     else:
-        message = (
-            "Queries should be a list or a dictionary, received: {}".format(
-                queries.__class__
-            )
-        )
-        raise ValueError(message)
+        reports = {key: None for key in queries}
+
+    for key, report in results:
+        reports[key] = report
+    return reports
 
 
 def setup_logging(default_path='logging.json', default_level=logging.INFO,
@@ -1,18 +1,24 @@
 from __future__ import absolute_import
 from __future__ import print_function
 
-import requests
 import binascii
 import json
 from datetime import datetime, date
 import logging
 import uuid
 import hashlib
-import base64
+import time
 import os
-import ast
-
-from omniture import reports, utils
+import tempfile
+import threading
+from multiprocessing.pool import ThreadPool
+
+from omniture import reports, snapshot as snapshots, utils
+from omniture.cache import FileCache, fingerprint
+from omniture.connection import ConnectionPool
+from omniture.retry import RetryPolicy, CircuitBreaker, TransientError, \
+    InvalidResponseError, READ_ONLY_METHODS
+from omniture.throttle import TokenBucket, QueueGovernor
 from omniture.elements import Value
 from omniture.query import Query
 
@@ -21,21 +27,121 @@ class Account(object):
     """ A wrapper for the Adobe Analytics API. Allows you to query
     the reporting API """
     DEFAULT_ENDPOINT = 'https://api.omniture.com/admin/1.4/rest/'
+    # only methods without side effects are coalesced, so every call to
+    # a method that does something goes out
+    COALESCED_METHODS = READ_ONLY_METHODS
+    # requests in flight at once when prefetching metadata
+    PREFETCH_CONCURRENCY = 10
+    # how long entries of the cache made for cache=True stay fresh, and how
+    # much disk it can use
+    DEFAULT_CACHE_TTL = 24 * 3600
+    DEFAULT_CACHE_SIZE = 100 * 2 ** 20
 
     def __init__(self, username, secret, endpoint=DEFAULT_ENDPOINT,
-                 cache=False, cache_key=None):
-        """Authentication to make requests."""
+                 cache=False, cache_key=None, pool_connections=10,
+                 pool_maxsize=10, pool_block=False, keep_alive=None,
+                 rate_limit=None, burst=None, max_queued=None, retry=None,
+                 circuit_breaker=None, coalesce=True, report_cache=None,
+                 current_ttl=300, lazy=False, snapshot=None):
+        """Authentication to make requests.
+
+        * pool_connections, pool_maxsize, pool_block, keep_alive -- tune
+            the keep-alive connection pool shared by every request made
+            through this account (see `omniture.connection.ConnectionPool`)
+        * rate_limit, burst -- the number of requests per second to send at
+            most, and how many can go out back to back (see
+            `omniture.throttle.TokenBucket`)
+        * max_queued -- the number of reports that can be in the Adobe
+            queue at the same time (see `omniture.throttle.QueueGovernor`)
+        * retry -- a `omniture.retry.RetryPolicy` for transient failures,
+            `False` to never retry
+        * circuit_breaker -- a `omniture.retry.CircuitBreaker` to fail fast
+            while the API is down, `False` to always try
+        * coalesce -- let threads that make the same request at the same
+            time share a single call to the API
+        * cache -- a `omniture.cache.Cache` to keep report suites, metadata
+            and report results in, or True for a `FileCache` in the temp
+            directory that keeps entries for `DEFAULT_CACHE_TTL` seconds
+            and takes up to `DEFAULT_CACHE_SIZE` bytes
+        * cache_key -- is part of every cache entry's key, so changing it
+            invalidates the cache. Defaults to today's date.
+        * report_cache -- a `omniture.cache.MemoryCache` that keeps finished
+            `Report` objects, so running the same query again returns the
+            same report without going to the API
+        * current_ttl -- the seconds cached results stay fresh for reports
+            that include today or ask for current data
+        * lazy -- don't fetch the report suites until `suites` is first
+            used. Use `suite` to get a report suite you know the id of
+            without listing them at all.
+        * snapshot -- the path of a snapshot written by `save_snapshot` to
+            take the report suites and their metadata from, instead of
+            the API
+        """
         self.log = logging.getLogger(__name__)
         self.log.info(datetime.now().strftime("%Y-%m-%d %I%p:%M:%S"))
         self.username = username
         self.secret = secret
         self.endpoint = endpoint
+        self.pool = ConnectionPool(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+            keep_alive=keep_alive
+        )
+        self._setup_policies(rate_limit, burst, max_queued, retry,
+                             circuit_breaker, coalesce)
+        self.in_flight = utils.SingleFlight()
+        self.interner = utils.Interner()
         # Allow someone to set a custom cache key
+        if cache is True:
+            cache = FileCache(
+                os.path.join(tempfile.gettempdir(), 'omniture-cache'),
+                ttl=self.DEFAULT_CACHE_TTL, max_size=self.DEFAULT_CACHE_SIZE)
         self.cache = cache
+        self.report_cache = report_cache
+        self.current_ttl = current_ttl
         if cache_key:
             self.cache_key = cache_key
         else:
             self.cache_key = date.today().isoformat()
+        self.lock = threading.Lock()
+        self._suites = None
+        self._unlisted = {}
+        if snapshot:
+            self.load_snapshot(snapshot)
+        elif not lazy:
+            self.suites
+
+    def _setup_policies(self, rate_limit, burst, max_queued, retry,
+                        circuit_breaker, coalesce):
+        """ Set up the rate limit, queue cap, retries, circuit breaker and
+        coalescing, see `__init__` """
+        self.limiter = TokenBucket(rate_limit, burst) if rate_limit else None
+        self.governor = QueueGovernor(max_queued) if max_queued else None
+        if retry is None:
+            retry = RetryPolicy()
+        self.retry = retry or RetryPolicy(retries=0)
+        if circuit_breaker is None:
+            circuit_breaker = CircuitBreaker()
+        self.circuit_breaker = circuit_breaker or None
+        self.coalesce = coalesce
+
+    @property
+    def suites(self):
+        """ The report suites of this account, fetched the first time
+        they are used """
+        if self._suites is None:
+            with self.lock:
+                if self._suites is None:
+                    self._suites = self.load_suites()
+        return self._suites
+
+    @suites.setter
+    def suites(self, suites):
+        self._suites = suites
+
+    def load_suites(self):
+        """ Fetch the list of report suites """
         if self.cache:
             data = self.request_cached(
                 'Company', 'GetReportSuites'
@@ -45,51 +151,101 @@ class Account(object):
         suites = [
             Suite(suite['site_title'], suite['rsid'], self) for suite in data
         ]
-        self.suites = utils.AddressableList(suites)
+        return utils.AddressableList(suites)
+
+    def _resolve_suites(self, suites=None):
+        """ Turn a list of report suites or their ids into report suites,
+        all of them by default """
+        if suites is None:
+            return list(self.suites)
+        return [
+            suite if isinstance(suite, Suite) else self.suite(suite)
+            for suite in suites
+        ]
 
-    def request_cached(self, api, method, query={}, cache_key=None):
-        if cache_key:
-            key = cache_key
-        else:
-            key = self.cache_key
+    def prefetch(self, suites=None, what=('metrics', 'elements', 'segments'),
+                 concurrency=None, progress=None):
+        """ Load the metadata of many report suites at once
 
-        # Generate a shortened hash of the query string so that method don't
-        # collide
-        query_hash = base64.urlsafe_b64encode(hashlib.md5(query).digest())
+        * suites -- the report suites (or their ids) to load, all of them by
+            default
+        * what -- which of metrics, elements and segments to load
+        * concurrency -- how many requests to have in flight,
+            `PREFETCH_CONCURRENCY` by default
+        * progress (optional) -- called as progress(suite, name, done,
+            total) every time a list is loaded
 
+        Returns the errors of the lists that couldn't be loaded, by report
+        suite id and name.
+        """
+        suites = self._resolve_suites(suites)
+        tasks = [(suite, name) for suite in suites for name in what]
+        errors = {}
+
+        def load(task):
+            suite, name = task
+            try:
+                getattr(suite, name)
+            except Exception as e:
+                self.log.warning("Couldn't load the %s of %s: %r",
+                                 name, suite.id, e)
+                errors[(suite.id, name)] = e
+            return task
+
+        pool = ThreadPool(concurrency or self.PREFETCH_CONCURRENCY)
         try:
-            with open(
-                self.file_path + '/data_' + api + '_' + method + '_' +
-                query_hash + '_' + key + '.txt'
-            ) as fp:
-                for line in fp:
-                    if line:
-                        data = ast.literal_eval(line)
-
-        except IOError as e:
-            data = self.request(api, method, query)
-
-            #  Capture all other old text files
-            # TODO decide if the query should be included in the file list to
-            # be cleared out when the cache key changes
-            filelist = [
-                f for f in os.listdir(self.file_path) if f.startswith(
-                    'data_' + api + '_' + method
-                )
-            ]
-
-            #  Delete them
-            for f in filelist:
-                os.remove(self.file_path + '/' + f)
-
-            #  Build the new data
-            the_file = open(
-                self.file_path +
-                '/data_' +
-                api + '_' + method + '_' + query_hash + '_' + key + '.txt', 'w'
-            )
-            the_file.write(str(data))
-            the_file.close()
+            for done, (suite, name) in enumerate(
+                    pool.imap_unordered(load, tasks), 1):
+                if progress:
+                    progress(suite, name, done, len(tasks))
+        finally:
+            pool.close()
+            pool.join()
+        return errors
+
+    def save_snapshot(self, path, suites=None):
+        """ Save the report suites with their metrics, elements and
+        segments to `path`, gzipped if it ends in .gz. Metadata that hasn't
+        been loaded yet is fetched first. """
+        suites = self._resolve_suites(suites)
+        self.prefetch(suites)
+        snapshots.save(self, path, suites)
+
+    def load_snapshot(self, path):
+        """ Take the report suites and their metadata from a snapshot
+        written by `save_snapshot` """
+        data = snapshots.load(path)
+        suites = []
+        for entry in data['suites']:
+            suite = Suite(entry['site_title'], entry['rsid'], self)
+            for name, rows in entry['metadata'].items():
+                suite.raw[name] = self.interner.table(rows)
+            suites.append(suite)
+        self.log.info("Loaded %s report suites from %s", len(suites), path)
+        self.suites = utils.AddressableList(suites)
+
+    def suite(self, rsid, title=None):
+        """ Return the report suite `rsid`. When the report suites haven't
+        been fetched it is made up on the spot, without a call to the API,
+        and titled `title` (the rsid by default). """
+        if self._suites is not None:
+            return self._suites[rsid]
+        with self.lock:
+            if rsid not in self._unlisted:
+                self._unlisted[rsid] = Suite(title or rsid, rsid, self)
+            return self._unlisted[rsid]
+
+    def request_cached(self, api, method, query={}, cache_key=None,
+                       ttl=None):
+        """
+        Same as `request`, but responses are stored in the account's cache
+        and served from it for as long as they are fresh. Entries are keyed
+        on the cache key (today's date unless set otherwise), the api, the
+        method and the query.
+        """
+        key = fingerprint(cache_key or self.cache_key, api, method, query)
+        return self.cache.fetch(
+            key, lambda: self.request(api, method, query), ttl)
 
     def request(self, api, method, query={}):
         """
@@ -101,18 +257,82 @@ class Account(object):
             of api
         * query -- a python object representing the parameters you would
             like to pass to the API
+
+        Connection problems, server errors and responses that aren't JSON
+        are retried according to the account's retry policy, after which
+        they raise `omniture.retry.TransientError`. Methods with side
+        effects are only retried when the request never went out.
+
+        Identical read-only requests (see `COALESCED_METHODS`) made by
+        several threads at the same time are sent only once and share the
+        response.
         """
+        if self._coalesces(api, method):
+            key = (api, method, json.dumps(query, sort_keys=True))
+            return self.in_flight.do(key, self._request, api, method, query)
+        else:
+            return self._request(api, method, query)
+
+    def _coalesces(self, api, method):
+        """ Whether identical calls to `method` can share a response """
+        return self.coalesce and \
+            api + '.' + method in self.COALESCED_METHODS
+
+    def _request(self, api, method, query):
         self.log.info("Request: %s.%s  Parameters: %s", api, method, query)
-        response = requests.post(
+        attempt = 0
+        while True:
+            trial = self.circuit_breaker and self.circuit_breaker.before()
+            try:
+                json_response = self._post(api, method, query)
+            except Exception as e:
+                if not self.retry.is_transient(e):
+                    if trial:
+                        self.circuit_breaker.cancel()
+                    raise
+                if self.circuit_breaker:
+                    self.circuit_breaker.failure()
+                if attempt >= self.retry.retries or \
+                        not self.retry.can_retry(e, api + '.' + method):
+                    raise TransientError(e)
+                delay = self.retry.delay(attempt)
+                self.log.warning("%s.%s failed (%r), retrying in %.1f seconds",
+                                 api, method, e, delay)
+                time.sleep(delay)
+                attempt += 1
+            except BaseException:
+                # interrupted or cancelled, the trial has to end anyway
+                if trial:
+                    self.circuit_breaker.cancel()
+                raise
+            else:
+                if self.circuit_breaker:
+                    self.circuit_breaker.success()
+                return self._handle_response(json_response)
+
+    def _post(self, api, method, query):
+        """ Send a single request, return the decoded response """
+        if self.limiter:
+            self.limiter.acquire()
+        response = self.pool.post(
             self.endpoint,
             params={'method': api + '.' + method},
             data=json.dumps(query),
             headers=self._build_token()
         )
         self.log.debug("Response for %s.%s:%s", api, method, response.text)
-        json_response = response.json()
-
-        if type(json_response) == dict:
+        self.retry.check(response)
+        try:
+            data = response.json()
+        except ValueError as e:
+            raise InvalidResponseError(e)
+        if isinstance(data, dict):
+            data = utils.Response(data, len(response.content))
+        return data
+
+    def _handle_response(self, json_response):
+        """ Raise the errors the API reports, return everything else """
+        if isinstance(json_response, dict):
             self.log.debug("Error Code %s", json_response.get('error'))
             if json_response.get('error') == 'report_not_ready':
                 raise reports.ReportNotReadyError(json_response)
@@ -123,13 +343,21 @@ class Account(object):
         else:
             return json_response
 
+    def queued_reports(self):
+        """ Return the ids of the reports that are still in the Adobe queue.
+        One request covers every report queued for the company. """
+        return set(
+            str(report['reportID'])
+            for report in self.request('Report', 'GetQueue')
+        )
+
     def jsonReport(self, reportJSON):
         """Generates a Report from the JSON (including selecting the report
         suite)"""
         if type(reportJSON) == str:
             reportJSON = json.loads(reportJSON)
         suiteID = reportJSON['reportDescription']['reportSuiteID']
-        suite = self.suites[suiteID]
+        suite = self.suite(suiteID)
         return suite.jsonReport(reportJSON)
 
     def _serialize_header(self, properties):
@@ -175,50 +403,69 @@ class Account(object):
 
 class Suite(Value):
     """Lets you query a specific report suite. """
+    # the api, method and query that fetch each kind of metadata
+    METADATA = {
+        'metrics': ('Report', 'GetMetrics', {}),
+        'elements': ('Report', 'GetElements', {}),
+        'segments': ('Segments', 'Get', {"accessLevel": "shared"}),
+    }
+
     def request(self, api, method, query={}):
+        return self.account.request(api, method, self._scope(method, query))
+
+    def _scope(self, method, query):
+        """ Add the report suite to queries for suite specific methods """
         raw_query = {}
         raw_query.update(query)
         if method == 'GetMetrics' or method == 'GetElements':
             raw_query['reportSuiteID'] = self.id
-
-        return self.account.request(api, method, raw_query)
+        return raw_query
 
     def __init__(self, title, id, account, cache=False):
         self.log = logging.getLogger(__name__)
         super(Suite, self).__init__(title, id, account)
         self.account = account
+        # the metadata as the API returned it, by name
+        self.raw = {}
+
+    def request_cached(self, api, method, query={}):
+        return self.account.request_cached(
+            api, method, self._scope(method, query))
+
+    def _metadata(self, api, method, query={}):
+        if self.account.cache:
+            return self.request_cached(api, method, query)
+        else:
+            return self.request(api, method, query)
+
+    def rows(self, name):
+        """ Return the metrics, elements or segments as the API returned
+        them, fetching them the first time """
+        if name not in self.raw:
+            api, method, query = self.METADATA[name]
+            self.raw[name] = self.account.interner.table(
+                self._metadata(api, method, query))
+        return self.raw[name]
 
     @property
     @utils.memoize
     def metrics(self):
         """ Return the list of valid metricsfor the current report suite"""
-        if self.account.cache:
-            data = self.request_cache('Report', 'GetMetrics')
-        else:
-            data = self.request('Report', 'GetMetrics')
-        return Value.list('metrics', data, self, 'name', 'id')
+        return Value.list('metrics', self.rows('metrics'), self, 'name', 'id')
 
     @property
     @utils.memoize
     def elements(self):
         """ Return the list of valid elementsfor the current report suite """
-        if self.account.cache:
-            data = self.request_cached('Report', 'GetElements')
-        else:
-            data = self.request('Report', 'GetElements')
-        return Value.list('elements', data, self, 'name', 'id')
+        return Value.list(
+            'elements', self.rows('elements'), self, 'name', 'id')
 
     @property
     @utils.memoize
     def segments(self):
         """ Return the list of valid segments for the current report suite """
-        if self.account.cache:
-            data = self.request_cached(
-                'Segments', 'Get', {"accessLevel": "shared"}
-            )
-        else:
-            data = self.request('Segments', 'Get', {"accessLevel": "shared"})
-        return Value.list('segments', data, self, 'name', 'id',)
+        return Value.list(
+            'segments', self.rows('segments'), self, 'name', 'id')
 
     @property
     def report(self):
@@ -0,0 +1,492 @@
+# encoding: utf-8
+"""
+asyncio counterparts of `Account`, `Suite` and `Query`.
+
+Requires Python 3.5+ and aiohttp. Everything that talks to the API is a
+coroutine, and queries can be awaited directly:
+
+    account = await omniture.aio.authenticate(os.environ)
+    suite = account.suites['reportsuite_name']
+    await suite.load()
+    report = await suite.report.metric('pageviews').range('2017-01-01')
+"""
+from __future__ import absolute_import
+
+import asyncio
+import inspect
+import json
+import logging
+import threading
+
+from omniture import reports, snapshot as snapshots, utils
+from omniture.account import Account, Suite
+from omniture.elements import Value
+from omniture.query import Query, ReportNotSubmittedError
+from omniture.retry import InvalidResponseError, TransientError
+
+
+class MetadataNotLoadedError(Exception):
+    """ Exception raised when metrics, elements or segments are used before
+        they have been loaded with `AsyncSuite.load`
+    """
+    def __init__(self, suite, name):
+        message = "The {name} of {suite} haven't been loaded yet, " \
+            "use `await suite.load('{name}')` first".format(
+                name=name, suite=suite.id)
+        super(MetadataNotLoadedError, self).__init__(message)
+
+
+class AsyncSingleFlight(object):
+    """ Lets coroutines that make the same call at the same time share a
+    single run of it, see `utils.SingleFlight` """
+    def __init__(self):
+        self.calls = {}
+
+    async def do(self, key, function, *args):
+        future = self.calls.get(key)
+        if future is None:
+            future = self.calls[key] = asyncio.ensure_future(function(*args))
+
+            def done(future):
+                if self.calls.get(key) is future:
+                    del self.calls[key]
+            future.add_done_callback(done)
+        # one caller giving up doesn't cancel the call for the others
+        return await asyncio.shield(future)
+
+
+class AsyncAccount(Account):
+    """ An asyncio wrapper for the Adobe Analytics API. Call `load` (or use
+    `omniture.aio.authenticate`) to fetch the report suites.
+
+    * pool_connections, pool_maxsize, keep_alive -- size of the aiohttp
+        connection pool: the number of hosts, connections per host and
+        the seconds idle connections are kept open
+    * session -- use an existing aiohttp.ClientSession instead
+    * rate_limit, burst, retry, circuit_breaker, coalesce -- as for
+        `Account`
+
+    Caches and the queue cap (`cache`, `report_cache` and `max_queued`)
+    block, so they aren't supported and raise a `ValueError`.
+    """
+    UNSUPPORTED = ('cache', 'report_cache', 'max_queued')
+
+    def __init__(self, username, secret, endpoint=Account.DEFAULT_ENDPOINT,
+                 pool_connections=10, pool_maxsize=10, keep_alive=None,
+                 session=None, rate_limit=None, burst=None, retry=None,
+                 circuit_breaker=None, coalesce=True, **kwargs):
+        for name, value in kwargs.items():
+            if name not in self.UNSUPPORTED:
+                raise TypeError(
+                    "Unexpected keyword argument {0!r}".format(name))
+            if value:
+                raise ValueError(
+                    "AsyncAccount doesn't support {0}".format(name))
+        self.log = logging.getLogger(__name__)
+        self.username = username
+        self.secret = secret
+        self.endpoint = endpoint
+        self.cache = False
+        self.report_cache = None
+        self.pool = None
+        self._setup_policies(rate_limit, burst, None, retry,
+                             circuit_breaker, coalesce)
+        self.in_flight = AsyncSingleFlight()
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.keep_alive = keep_alive
+        self.session = session
+        self.interner = utils.Interner()
+        self.lock = threading.Lock()
+        self._suites = None
+        self._unlisted = {}
+
+    @property
+    def suites(self):
+        """ The report suites, None until `load` has fetched them """
+        return self._suites
+
+    @suites.setter
+    def suites(self, suites):
+        self._suites = suites
+
+    def suite(self, rsid, title=None):
+        """ Return the report suite `rsid`, see `Account.suite` """
+        if self._suites is not None:
+            return self._suites[rsid]
+        with self.lock:
+            if rsid not in self._unlisted:
+                self._unlisted[rsid] = AsyncSuite(title or rsid, rsid, self)
+            return self._unlisted[rsid]
+
+    def _get_session(self):
+        # the session has to be created from within the event loop
+        if self.session is None:
+            import aiohttp
+            options = {
+                'limit': self.pool_connections * self.pool_maxsize,
+                'limit_per_host': self.pool_maxsize,
+            }
+            if self.keep_alive is not None:
+                options['keepalive_timeout'] = self.keep_alive
+            connector = aiohttp.TCPConnector(**options)
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+    async def load(self):
+        """ Fetch the report suites for this account """
+        data = await self.request('Company', 'GetReportSuites')
+        suites = [
+            AsyncSuite(suite['site_title'], suite['rsid'], self)
+            for suite in data['report_suites']
+        ]
+        self.suites = utils.AddressableList(suites)
+        return self
+
+    async def request(self, api, method, query={}):
+        """
+        Make a request to the Adobe APIs. See `Account.request`
+        """
+        if self._coalesces(api, method):
+            key = (api, method, json.dumps(query, sort_keys=True))
+            return await self.in_flight.do(
+                key, self._request, api, method, query)
+        return await self._request(api, method, query)
+
+    def _is_transient(self, error):
+        import aiohttp
+        return isinstance(error, (
+            aiohttp.ClientError, asyncio.TimeoutError, InvalidResponseError))
+
+    def _can_retry(self, error, method):
+        """ See `RetryPolicy.can_retry` """
+        import aiohttp
+        return method in self.retry.read_only or \
+            isinstance(error, aiohttp.ClientConnectorError)
+
+    async def _request(self, api, method, query):
+        self.log.info("Request: %s.%s  Parameters: %s", api, method, query)
+        attempt = 0
+        while True:
+            trial = self.circuit_breaker and self.circuit_breaker.before()
+            try:
+                json_response = await self._post(api, method, query)
+            except Exception as e:
+                if not self._is_transient(e):
+                    if trial:
+                        self.circuit_breaker.cancel()
+                    raise
+                if self.circuit_breaker:
+                    self.circuit_breaker.failure()
+                if attempt >= self.retry.retries or \
+                        not self._can_retry(e, api + '.' + method):
+                    raise TransientError(e)
+                delay = self.retry.delay(attempt)
+                self.log.warning("%s.%s failed (%r), retrying in %.1f seconds",
+                                 api, method, e, delay)
+                await asyncio.sleep(delay)
+                attempt += 1
+            except BaseException:
+                # interrupted or cancelled, the trial has to end anyway
+                if trial:
+                    self.circuit_breaker.cancel()
+                raise
+            else:
+                if self.circuit_breaker:
+                    self.circuit_breaker.success()
+                return self._handle_response(json_response)
+
+    async def _post(self, api, method, query):
+        """ Send a single request, return the decoded response """
+        if self.limiter:
+            wait = self.limiter.try_acquire()
+            while wait:
+                await asyncio.sleep(wait)
+                wait = self.limiter.try_acquire()
+        response = await self._get_session().post(
+            self.endpoint,
+            params={'method': api + '.' + method},
+            data=json.dumps(query),
+            headers=self._build_token()
+        )
+        try:
+            if response.status in self.retry.statuses:
+                response.raise_for_status()
+            text = await response.text()
+        finally:
+            response.release()
+        self.log.debug("Response for %s.%s:%s", api, method, text)
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            raise InvalidResponseError(e)
+        if isinstance(data, dict):
+            data = utils.Response(data, len(text))
+        return data
+
+    async def prefetch(self, suites=None,
+                       what=('metrics', 'elements', 'segments'),
+                       concurrency=None, progress=None):
+        """ Load the metadata of many report suites at once, see
+        `Account.prefetch` """
+        if suites is None and self.suites is None:
+            await self.load()
+        suites = self._resolve_suites(suites)
+        tasks = [(suite, name) for suite in suites for name in what]
+        semaphore = asyncio.Semaphore(
+            concurrency or self.PREFETCH_CONCURRENCY)
+        errors = {}
+        done = 0
+
+        async def load(suite, name):
+            nonlocal done
+            async with semaphore:
+                try:
+                    await suite.load(name)
+                except Exception as e:
+                    self.log.warning("Couldn't load the %s of %s: %r",
+                                     name, suite.id, e)
+                    errors[(suite.id, name)] = e
+            done += 1
+            if progress:
+                progress(suite, name, done, len(tasks))
+
+        await asyncio.gather(*[load(suite, name) for suite, name in tasks])
+        return errors
+
+    async def save_snapshot(self, path, suites=None):
+        """ See `Account.save_snapshot` """
+        if suites is None and self.suites is None:
+            await self.load()
+        suites = self._resolve_suites(suites)
+        errors = await self.prefetch(suites)
+        if errors:
+            raise next(iter(errors.values()))
+        snapshots.save(self, path, suites)
+
+    async def queued_reports(self):
+        """ See `Account.queued_reports` """
+        return set(
+            str(report['reportID'])
+            for report in await self.request('Report', 'GetQueue')
+        )
+
+    async def close(self):
+        """ Close the connection pool """
+        if self.session is not None:
+            closed = self.session.close()
+            if inspect.isawaitable(closed):
+                await closed
+            self.session = None
+
+    async def __aenter__(self):
+        if self.suites is None:
+            await self.load()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+class AsyncSuite(Suite):
+    """Lets you query a specific report suite from a coroutine. The
+    metrics, elements and segments have to be loaded with `load` before
+    they can be used to validate queries. """
+
+    def __init__(self, title, id, account, cache=False):
+        super(AsyncSuite, self).__init__(title, id, account, cache)
+        self.metadata = {}
+
+    async def request(self, api, method, query={}):
+        return await self.account.request(
+            api, method, self._scope(method, query))
+
+    async def load(self, *names):
+        """ Load metrics, elements and/or segments concurrently. Loads all
+        three when called without arguments. """
+        names = [
+            name for name in names or sorted(self.METADATA)
+            if name not in self.metadata
+        ]
+        await asyncio.gather(*[self._load(name) for name in names])
+        return self
+
+    async def _load(self, name):
+        if name not in self.raw:
+            api, method, query = self.METADATA[name]
+            self.raw[name] = self.account.interner.table(
+                await self.request(api, method, query))
+        self.metadata[name] = Value.list(
+            name, self.raw[name], self, 'name', 'id')
+
+    def rows(self, name):
+        """ Return the metrics, elements or segments as the API returned
+        them, once they have been loaded """
+        try:
+            return self.raw[name]
+        except KeyError:
+            raise MetadataNotLoadedError(self, name)
+
+    def _loaded(self, name):
+        try:
+            return self.metadata[name]
+        except KeyError:
+            raise MetadataNotLoadedError(self, name)
+
+    @property
+    def metrics(self):
+        """ Return the list of valid metrics for the current report suite"""
+        return self._loaded('metrics')
+
+    @property
+    def elements(self):
+        """ Return the list of valid elements for the current report suite """
+        return self._loaded('elements')
+
+    @property
+    def segments(self):
+        """ Return the list of valid segments for the current report suite """
+        return self._loaded('segments')
+
+    @property
+    def report(self):
+        """ Return a report to be run on this report suite """
+        return AsyncQuery(self)
+
+
+class AsyncQuery(Query):
+    """ A `Query` whose requests are coroutines. Awaiting the query runs it
+    and returns the report. """
+
+    async def queue(self):
+        """ Submits the report to the Queue on the Adobe side. """
+        q = self.build()
+        self.log.debug("Suite Object: %s  Method: %s, Query %s",
+                       self.suite, self.report.method, q)
+        response = await self.suite.request('Report', self.report.method, q)
+        self.id = response['reportID']
+        self.status = self.STATUSES[1]
+        return self
+
+    async def probe(self, heartbeat=None, interval=1, soak=False):
+        """ Keep checking until the report is done"""
+        while await self.poll() is False:
+            if heartbeat:
+                heartbeat()
+            await asyncio.sleep(interval)
+            interval = utils.backoff(interval)
+            self.log.debug("Check Interval: %s seconds", interval)
+
+    async def poll(self):
+        """ See `Query.poll` """
+        try:
+            return await self.is_ready()
+        except TransientError as e:
+            self.log.warning("Couldn't check on report %s: %s", self.id, e)
+            return False
+
+    async def is_ready(self):
+        """ inspects the response to see if the report is ready """
+        if self.status == self.STATUSES[0]:
+            raise ReportNotSubmittedError(
+                '{"message":"Doh! the report needs to be submitted first"}'
+            )
+        elif self.status == self.STATUSES[1]:
+            try:
+                response = await self.suite.request(
+                    'Report', 'Get', {'reportID': self.id}
+                )
+            except reports.ReportNotReadyError:
+                return False
+            # the report looks its segments up on the suite
+            if response.get('report', {}).get('segments'):
+                await self.suite.load('segments')
+            self.status = self.STATUSES[2]
+            self.unprocessed_response = response
+            self.processed_response = self.report(response, self)
+            return True
+        elif self.status == self.STATUSES[2]:
+            return True
+
+    async def sync(self, heartbeat=None, interval=0.01):
+        """ Queue the report and wait until it is done """
+        if self.status == self.STATUSES[0]:
+            await self.queue()
+            await self.probe(heartbeat, interval)
+        if self.status == self.STATUSES[1]:
+            await self.probe()
+        return self.processed_response
+
+    async def get_report(self):
+        await self.is_ready()
+        if self.status == self.STATUSES[2]:
+            return self.processed_response
+        else:
+            raise reports.ReportNotReadyError(
+                '{"message":"Doh! the report is not ready yet"}'
+            )
+
+    async def write_csv(self, fp, heartbeat=None, interval=0.01, **kwargs):
+        """ Run the report and write its rows to `fp` as CSV, see
+        `Report.write_csv` """
+        report = await self.sync(heartbeat, interval)
+        return report.write_csv(fp, **kwargs)
+
+    async def write_jsonl(self, fp, heartbeat=None, interval=0.01):
+        """ Run the report and write its rows to `fp` as JSON lines, see
+        `Report.write_jsonl` """
+        report = await self.sync(heartbeat, interval)
+        return report.write_jsonl(fp)
+
+    async def cancel(self):
+        """ Cancels a the report from the Queue on the Adobe side. """
+        response = await self.suite.request(
+            'Report', 'CancelReport', {'reportID': self.id})
+        self.release_slot()
+        return response
+
+    def __await__(self):
+        return self.sync().__await__()
+
+
+def _run_in_background(self, *args, **kwargs):
+    raise TypeError(
+        "AsyncQuery can't be run in the background, "
+        "use asyncio.ensure_future(query.sync()) instead")
+
+
+# `Query.async` would hand back a coroutine without running it, and async
+# is a keyword from Python 3.7 on
+setattr(AsyncQuery, 'async', _run_in_background)
+
+
+async def authenticate(username, secret=None,
+                       endpoint=Account.DEFAULT_ENDPOINT,
+                       prefix='', suffix='', lazy=False, **kwargs):
+    """ Authenticate to the Adobe API and load the report suites, unless
+    `lazy` is set. Takes the same arguments as `omniture.authenticate`. """
+    username, secret = utils.credentials(username, secret, prefix, suffix)
+    account = AsyncAccount(username, secret, endpoint, **kwargs)
+    if lazy:
+        return account
+    return await account.load()
+
+
+async def sync(queries, heartbeat=None, interval=1):
+    """ Run a list or a dictionary of queries concurrently and return the
+    reports in the same shape """
+    if isinstance(queries, list):
+        return list(await asyncio.gather(
+            *[query.sync(heartbeat, interval) for query in queries]))
+    elif isinstance(queries, dict):
+        keys = list(queries)
+        results = await asyncio.gather(
+            *[queries[key].sync(heartbeat, interval) for key in keys])
+        return dict(zip(keys, results))
+    else:
+        message = (
+            "Queries should be a list or a dictionary, received: {}".format(
+                queries.__class__
+            )
+        )
+        raise ValueError(message)
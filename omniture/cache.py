@@ -0,0 +1,433 @@
+# encoding: utf-8
+from __future__ import absolute_import
+
+import collections
+import errno
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+
+def fingerprint(*parts):
+    """ Return a stable key for any JSON serializable values. Dictionaries
+    are serialized with sorted keys so equivalent queries share a key. """
+    canonical = json.dumps(parts, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class Cache(object):
+    """ Interface for response caches
+
+    Keys are strings (see `fingerprint`) and values are anything the API
+    returns. Backends implement `get`, `set`, `delete` and `clear`.
+
+    * ttl -- seconds an entry stays fresh when `set` isn't given a ttl,
+        None keeps entries until they are evicted
+    """
+    def __init__(self, ttl=None):
+        self.log = logging.getLogger(__name__)
+        self.ttl = ttl
+
+    def get(self, key):
+        """ Return the value stored under `key`, raise KeyError when there
+        is no fresh entry """
+        raise NotImplementedError()
+
+    def set(self, key, value, ttl=None):
+        """ Store `value` under `key` for `ttl` seconds (or the default) """
+        raise NotImplementedError()
+
+    def delete(self, key):
+        raise NotImplementedError()
+
+    def clear(self):
+        raise NotImplementedError()
+
+    def fetch(self, key, compute, ttl=None):
+        """ Return the value stored under `key`, or call `compute` and store
+        its result when there is none """
+        try:
+            return self.get(key)
+        except KeyError:
+            value = compute()
+            self.set(key, value, ttl)
+            return value
+
+    def expires(self, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+        if ttl is None:
+            return None
+        return time.time() + ttl
+
+    def __contains__(self, key):
+        try:
+            self.get(key)
+            return True
+        except KeyError:
+            return False
+
+
+class FileCache(Cache):
+    """ Cache responses as JSON files in a directory
+
+    Entries are written to a temporary file and moved into place, so
+    readers never see a half written entry, even with several processes
+    sharing the directory. Reading an entry marks it as recently used.
+    When the cache grows past `max_size` bytes or `max_entries` files the
+    least recently used entries are removed.
+
+    * path -- the directory to keep the cache in, created if needed
+    * ttl -- the default number of seconds entries stay fresh
+    * max_size (optional) -- the most bytes to keep on disk
+    * max_entries (optional) -- the most entries to keep
+    """
+    SUFFIX = '.json'
+
+    def __init__(self, path, ttl=None, max_size=None, max_entries=None):
+        super(FileCache, self).__init__(ttl)
+        self.path = path
+        self.max_size = max_size
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        try:
+            os.makedirs(path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def _file(self, key):
+        return os.path.join(self.path, key + self.SUFFIX)
+
+    def get(self, key):
+        path = self._file(key)
+        try:
+            with open(path) as fp:
+                entry = json.load(fp)
+        except (IOError, OSError):
+            raise KeyError(key)
+        except ValueError:
+            self.log.warning("Removing corrupt cache entry %s", path)
+            self.delete(key)
+            raise KeyError(key)
+
+        expires = entry.get('expires')
+        if expires is not None and expires < time.time():
+            self.delete(key)
+            raise KeyError(key)
+
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return entry['value']
+
+    def set(self, key, value, ttl=None):
+        entry = {'expires': self.expires(ttl), 'value': value}
+        fd, temp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(entry, fp, separators=(',', ':'))
+            # os.replace isn't available on Python 2
+            getattr(os, 'replace', os.rename)(temp, self._file(key))
+        except:
+            os.remove(temp)
+            raise
+        self.evict()
+
+    def delete(self, key):
+        try:
+            os.remove(self._file(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for name, size, used in self._entries():
+            self.delete(name[:-len(self.SUFFIX)])
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith(self.SUFFIX):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+            entries.append((name, stat.st_size, stat.st_mtime))
+        return entries
+
+    def evict(self):
+        """ Remove the least recently used entries until the cache fits """
+        if self.max_size is None and self.max_entries is None:
+            return
+        with self.lock:
+            entries = sorted(self._entries(), key=lambda entry: entry[2])
+            size = sum(entry[1] for entry in entries)
+            while entries and (
+                (self.max_size is not None and size > self.max_size) or
+                (self.max_entries is not None and
+                    len(entries) > self.max_entries)
+            ):
+                name, entry_size, used = entries.pop(0)
+                self.delete(name[:-len(self.SUFFIX)])
+                size -= entry_size
+
+    def __repr__(self):
+        return "<FileCache: {0}>".format(self.path)
+
+
+class MemoryCache(Cache):
+    """ Keep values in memory, for the life of the process
+
+    Unlike the other backends it doesn't serialize values, so it can hold
+    on to finished `Report` objects and hand back the very same object.
+    The least recently used entries are evicted when there are more than
+    `max_entries` or their estimated size passes `max_size` bytes. Values
+    such as reports grow as they are used, so sizes are measured again
+    whenever an entry is read and, for every entry, when one is added.
+
+    * ttl -- the default number of seconds entries stay fresh
+    * max_entries (optional) -- the most entries to keep
+    * max_size (optional) -- the most bytes to keep, as measured by
+        `sizeof`
+    * sizeof (optional) -- estimates the size of a value in bytes,
+        `sys.getsizeof` by default
+    """
+    def __init__(self, ttl=None, max_entries=128, max_size=None,
+                 sizeof=sys.getsizeof):
+        super(MemoryCache, self).__init__(ttl)
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.size = 0
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value, expires, size = self.entries[key]
+            if expires is not None and expires < time.time():
+                self._delete(key)
+                raise KeyError(key)
+            # move to the end, which is the most recently used
+            del self.entries[key]
+            if self.max_size is not None:
+                self.size -= size
+                size = self.sizeof(value)
+                self.size += size
+            self.entries[key] = (value, expires, size)
+            self.evict(keep=key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        size = self.sizeof(value) if self.max_size is not None else 0
+        if self.max_size is not None and size > self.max_size:
+            self.log.debug("Not caching %s, it is larger than the cache", key)
+            return
+        with self.lock:
+            self._delete(key)
+            self.measure()
+            self.entries[key] = (value, self.expires(ttl), size)
+            self.size += size
+            self.evict()
+
+    def measure(self):
+        """ Measure every entry again """
+        if self.max_size is None:
+            return
+        self.size = 0
+        for key, (value, expires, size) in list(self.entries.items()):
+            size = self.sizeof(value)
+            self.entries[key] = (value, expires, size)
+            self.size += size
+
+    def _delete(self, key):
+        if key in self.entries:
+            self.size -= self.entries.pop(key)[2]
+
+    def delete(self, key):
+        with self.lock:
+            self._delete(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def evict(self, keep=None):
+        """ Remove the least recently used entries until the cache fits,
+        except for `keep` """
+        while self.entries and (
+            (self.max_entries is not None and
+                len(self.entries) > self.max_entries) or
+            (self.max_size is not None and self.size > self.max_size)
+        ):
+            key = next(iter(self.entries))
+            if key == keep:
+                break
+            self._delete(key)
+
+    def __repr__(self):
+        return "<MemoryCache: {0} entries>".format(len(self.entries))
+
+
+class SQLiteCache(Cache):
+    """ Cache responses in a SQLite database shared by every process on a
+    host
+
+    The database runs in WAL mode so readers don't block writers. When an
+    entry needs refreshing through `fetch`, the process that refreshes it
+    first takes a lease on the key. Other processes serve the stale value
+    in the meantime, or wait for the new one when there is none.
+
+    * path -- the database file, created if needed
+    * ttl -- the default number of seconds entries stay fresh
+    * max_entries (optional) -- the most entries to keep, least recently
+        used ones are removed first
+    * lease_timeout -- seconds after which the lease of a process that
+        didn't finish its refresh is up for grabs again
+    * wait -- the longest a process waits for someone else's refresh
+        before doing it itself
+    """
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, "
+        "value TEXT NOT NULL, expires REAL, used REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS entries_used ON entries (used)",
+        "CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, "
+        "holder TEXT NOT NULL, expires REAL NOT NULL)",
+    ]
+
+    def __init__(self, path, ttl=None, max_entries=None, lease_timeout=60,
+                 wait=30, poll_interval=0.1, timeout=30):
+        super(SQLiteCache, self).__init__(ttl)
+        self.path = path
+        self.max_entries = max_entries
+        self.lease_timeout = lease_timeout
+        self.wait = wait
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.local = threading.local()
+        connection = self.connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        for statement in self.SCHEMA:
+            connection.execute(statement)
+
+    def connection(self):
+        """ SQLite connections can't be shared between threads or carried
+        over a fork, so every thread of every process gets its own """
+        if getattr(self.local, 'pid', None) != os.getpid():
+            self.local.connection = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None)
+            self.local.pid = os.getpid()
+        return self.local.connection
+
+    def _entry(self, key):
+        """ Return the value and expiry of an entry, fresh or not """
+        row = self.connection().execute(
+            "SELECT value, expires FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return json.loads(row[0]), row[1]
+
+    def get(self, key):
+        value, expires = self._entry(key)
+        if expires is not None and expires < time.time():
+            raise KeyError(key)
+        if self.max_entries is not None:
+            self.connection().execute(
+                "UPDATE entries SET used = ? WHERE key = ?",
+                (time.time(), key))
+        return value
+
+    def set(self, key, value, ttl=None):
+        connection = self.connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO entries (key, value, expires, used) "
+            "VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value, separators=(',', ':')),
+             self.expires(ttl), time.time()))
+        if self.max_entries is not None:
+            connection.execute(
+                "DELETE FROM entries WHERE key NOT IN "
+                "(SELECT key FROM entries ORDER BY used DESC LIMIT ?)",
+                (self.max_entries,))
+
+    def delete(self, key):
+        self.connection().execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def clear(self):
+        self.connection().execute("DELETE FROM entries")
+
+    def acquire(self, key, holder):
+        """ Try to take the lease to refresh `key` """
+        connection = self.connection()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "DELETE FROM leases WHERE key = ? AND expires < ?",
+                (key, now))
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO leases (key, holder, expires) "
+                "VALUES (?, ?, ?)", (key, holder, now + self.lease_timeout))
+            acquired = cursor.rowcount == 1
+            connection.execute("COMMIT")
+        except:
+            connection.execute("ROLLBACK")
+            raise
+        return acquired
+
+    def release(self, key, holder):
+        self.connection().execute(
+            "DELETE FROM leases WHERE key = ? AND holder = ?", (key, holder))
+
+    def fetch(self, key, compute, ttl=None):
+        """ Return the value stored under `key`. When it is missing or stale
+        only one process calls `compute` to refresh it. """
+        try:
+            value, expires = self._entry(key)
+            found = True
+        except KeyError:
+            found = False
+        if found and (expires is None or expires >= time.time()):
+            return value
+
+        holder = "{0}:{1}:{2}".format(
+            os.getpid(), threading.current_thread().ident, uuid.uuid4().hex)
+        deadline = time.time() + self.wait
+        while not self.acquire(key, holder):
+            if found:
+                self.log.debug("Serving stale %s while it is refreshed", key)
+                return value
+            if time.time() > deadline:
+                self.log.warning("Gave up waiting on the refresh of %s", key)
+                return compute()
+            time.sleep(self.poll_interval)
+            try:
+                return self.get(key)
+            except KeyError:
+                pass
+
+        try:
+            # the entry may have been refreshed while we were waiting
+            try:
+                return self.get(key)
+            except KeyError:
+                pass
+            value = compute()
+            self.set(key, value, ttl)
+            return value
+        finally:
+            self.release(key, holder)
+
+    def __repr__(self):
+        return "<SQLiteCache: {0}>".format(self.path)
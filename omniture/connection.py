@@ -0,0 +1,93 @@
+from __future__ import absolute_import
+
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class ConnectionPool(object):
+    """ Keep-alive HTTP connections to the Adobe API
+
+    An account owns a single pool and every suite and query made from
+    that account sends its requests through it, so TCP and TLS handshakes
+    are only paid for when a new connection is actually needed.
+
+    * pool_connections -- the number of hosts to keep connections for
+    * pool_maxsize -- the maximum number of connections kept per host
+    * pool_block -- wait for a free connection instead of opening a
+        throwaway one when `pool_maxsize` connections are busy
+    * keep_alive -- seconds a pool may sit idle before its connections
+        are dropped and reopened on the next request (None keeps them
+        open for as long as the server allows)
+    """
+    def __init__(self, pool_connections=10, pool_maxsize=10,
+                 pool_block=False, keep_alive=None):
+        self.log = logging.getLogger(__name__)
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
+        self.lock = threading.Lock()
+        self.session = None
+        self.last_used = None
+        self.in_flight = 0
+
+    def _build_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=self.pool_block
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def _is_stale(self, now):
+        return (
+            self.session is not None and
+            self.keep_alive is not None and
+            self.in_flight == 0 and
+            now - self.last_used > self.keep_alive
+        )
+
+    def _checkout(self):
+        with self.lock:
+            now = time.time()
+            if self._is_stale(now):
+                self.log.debug("Connections idle for %.1f seconds, reopening",
+                               now - self.last_used)
+                self.session.close()
+                self.session = None
+            if self.session is None:
+                self.session = self._build_session()
+            self.in_flight += 1
+            self.last_used = now
+            return self.session
+
+    def _checkin(self):
+        with self.lock:
+            self.in_flight -= 1
+            self.last_used = time.time()
+
+    def post(self, url, **kwargs):
+        """ Send a POST request over a pooled connection """
+        session = self._checkout()
+        try:
+            return session.post(url, **kwargs)
+        finally:
+            self._checkin()
+
+    def close(self):
+        """ Close every open connection. The pool reopens on next use. """
+        with self.lock:
+            if self.session is not None:
+                self.session.close()
+                self.session = None
+
+    def __repr__(self):
+        return "<ConnectionPool: {0} hosts x {1} connections>".format(
+            self.pool_connections, self.pool_maxsize)
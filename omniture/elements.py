@@ -2,38 +2,54 @@
 from __future__ import absolute_import
 from __future__ import print_function
 
-import copy
-import logging
+import threading
 
 from omniture import utils
 
+# held while a lazy list swaps a row for its value
+_creating = threading.Lock()
+
 
 class Value(object):
-    """ Searchable Dict. Can search on both the key and the value """
-    def __init__(self, title, id, parent, extra={}):
-        self.log = logging.getLogger(__name__)
+    """ Searchable Dict. Can search on both the key and the value
+
+    Only the title, id and parent are kept on the object. The other fields
+    the API returned for it stay in `extra` and are read from there as
+    attributes, e.g. `metric.type`.
+    """
+    __slots__ = ('title', 'id', 'parent', 'extra', '__weakref__')
+
+    def __init__(self, title, id, parent, extra=None):
         self.title = str(title)
         self.id = id
         self.parent = parent
-        self.properties = {'id': id}
+        self.extra = extra if extra is not None else {}
 
-        for k, v in extra.items():
-            setattr(self, k, v)
+    def __getattr__(self, name):
+        # copy and pickle look for special methods before the slots are
+        # filled in, which mustn't end up in `extra`
+        if name.startswith('_') or name in Value.__slots__:
+            raise AttributeError(name)
+        try:
+            return self.extra[name]
+        except KeyError:
+            raise AttributeError(
+                "{0!r} has no attribute {1!r}".format(self, name))
 
     @classmethod
     def list(cls, name, items, parent, title='title', id='id'):
-        values = [
-            cls(item[title], str(item[id]), parent, item) for item in items
-        ]
-        return utils.AddressableList(values, name)
+        return LazyValueList(cls, name, items, parent, title, id)
+
+    @property
+    def properties(self):
+        return {'id': self.id}
 
     def __repr__(self):
-        print(self)
-        return "<{title}: {id} in {parent}>".format(**self.__dict__)
+        return "<{0}: {1} in {2}>".format(self.title, self.id, self.parent)
 
     def copy(self):
         value = self.__class__(self.title, self.id, self.parent)
-        value.properties = copy.copy(self.properties)
+        value.extra = self.extra
         return value
 
     def serialize(self):
@@ -47,3 +63,88 @@ class Value(object):
         """ allows users to print this out in a user friendly using print
         """
         return "ID {0:25} | Name: {1} \n".format(self.id, self.title)
+
+
+class LazyValueList(utils.AddressableList):
+    """ AddressableList of `Value` objects that are only created when they
+    are used
+
+    The list starts out holding the rows from the API, and each row is
+    swapped for its `Value` the first time it is accessed. Lookups by id or
+    title are resolved from the rows, so they only create the value that
+    is asked for. Operations that compare or reorder items, such as `in`,
+    `index` and `sort`, create every value first.
+    """
+    def __init__(self, cls, name, rows, parent, title='title', id='id'):
+        super(LazyValueList, self).__init__(rows, name)
+        self.cls = cls
+        self.parent = parent
+        self.title_key = title
+        self.id_key = id
+
+    def _item(self, position):
+        item = list.__getitem__(self, position)
+        if isinstance(item, Value):
+            return item
+        # so that threads asking for the same row all get the same value
+        with _creating:
+            item = list.__getitem__(self, position)
+            if not isinstance(item, Value):
+                row = item
+                item = self.cls(row[self.title_key], str(row[self.id_key]),
+                                self.parent, row)
+                # the index stays valid, the keys of the value are the same
+                list.__setitem__(self, position, item)
+        return item
+
+    def _index_keys(self, position):
+        item = list.__getitem__(self, position)
+        if isinstance(item, Value):
+            return (item.title, item.id)
+        return (str(item[self.title_key]), str(item[self.id_key]))
+
+    def materialize(self):
+        """ Create every value that hasn't been created yet """
+        for position in range(len(self)):
+            self._item(position)
+        return self
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self._item(position)
+                    for position in range(*key.indices(len(self)))]
+        elif isinstance(key, int):
+            return self._item(key)
+        return super(LazyValueList, self).__getitem__(key)
+
+    def __getslice__(self, start, stop):
+        # Python 2
+        return self[max(start, 0):max(stop, 0)]
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self._item(position)
+
+    def __reversed__(self):
+        for position in reversed(range(len(self))):
+            yield self._item(position)
+
+    def _materialized(name):
+        def method(self, *args, **kwargs):
+            self.materialize()
+            return getattr(
+                super(LazyValueList, self), name)(*args, **kwargs)
+        method.__name__ = name
+        return method
+
+    __contains__ = _materialized('__contains__')
+    __eq__ = _materialized('__eq__')
+    __ne__ = _materialized('__ne__')
+    __add__ = _materialized('__add__')
+    __mul__ = _materialized('__mul__')
+    index = _materialized('index')
+    count = _materialized('count')
+    pop = _materialized('pop')
+    remove = _materialized('remove')
+    sort = _materialized('sort')
+    del _materialized
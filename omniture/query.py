@@ -2,6 +2,7 @@
 from __future__ import absolute_import
 from __future__ import print_function
 
+import datetime
 import time
 from copy import copy, deepcopy
 import functools
@@ -11,7 +12,9 @@ import logging
 import sys
 
 from omniture import reports, utils
+from omniture.cache import fingerprint
 from omniture.elements import Value
+from omniture.retry import TransientError
 
 
 def immutable(method):
@@ -65,6 +68,8 @@ class Query(object):
         # The fully hydrated report object
         self.processed_response = None
         self.unprocessed_response = None
+        # whether this query holds one of the account's queue slots
+        self.slot = False
 
     def _normalize_value(self, value, category):
         if isinstance(value, Value):
@@ -91,7 +96,7 @@ class Query(object):
 
     def clone(self):
         """ Return a copy of the current object. """
-        query = Query(self.suite)
+        query = self.__class__(self.suite)
         query.raw = copy(self.raw)
         query.report = self.report
         query.status = self.status
@@ -292,33 +297,134 @@ class Query(object):
         """ Return the report descriptoin as an object """
         return {'reportDescription': self.raw}
 
-    def queue(self):
-        """ Submits the report to the Queue on the Adobe side. """
+    def queue(self, block=True):
+        """ Submits the report to the Queue on the Adobe side.
+
+        If the account caps the number of queued reports this waits for a
+        free slot, or raises `omniture.throttle.QueueFullError` when
+        `block` is False.
+        """
         q = self.build()
+        if self.from_cache():
+            self.log.debug("Report served from cache: %s", q)
+            return self
         self.log.debug("Suite Object: %s  Method: %s, Query %s",
                        self.suite, self.report.method, q)
-        self.id = self.suite.request('Report',
-                                     self.report.method,
-                                     q)['reportID']
+        self.acquire_slot(block)
+        try:
+            self.id = self.suite.request('Report',
+                                         self.report.method,
+                                         q)['reportID']
+        except:
+            self.release_slot()
+            raise
         self.status = self.STATUSES[1]
         return self
 
+    def cache_key(self):
+        """ Key the results of this report are cached under """
+        return fingerprint(self.suite.account.cache_key, 'Report',
+                           self.report.method, self.build())
+
+    def is_current(self):
+        """ Whether the report covers today, in which case its numbers can
+        still change """
+        if self.raw.get('currentData'):
+            return True
+        end = self.raw.get('dateTo') or self.raw.get('date')
+        return end is None or end >= datetime.date.today().isoformat()
+
+    def cache_ttl(self):
+        """ How long the results can be cached for. None leaves it up to
+        the cache. """
+        if self.is_current():
+            return self.suite.account.current_ttl
+        return None
+
+    def from_cache(self):
+        """ Load the results from the account's caches, if they have them """
+        account = self.suite.account
+        if not (account.report_cache or account.cache):
+            return False
+        key = self.cache_key()
+
+        if account.report_cache:
+            try:
+                report = account.report_cache.get(key)
+            except KeyError:
+                pass
+            else:
+                self.status = self.STATUSES[2]
+                self.release_slot()
+                self.unprocessed_response = report.raw
+                self.processed_response = report
+                return True
+
+        if account.cache:
+            try:
+                response = account.cache.get(key)
+            except KeyError:
+                return False
+            self.finish(response)
+            if account.report_cache:
+                account.report_cache.set(
+                    key, self.processed_response, self.cache_ttl())
+            return True
+
+        return False
+
+    def to_cache(self):
+        """ Store the results of a finished report in the account's caches """
+        account = self.suite.account
+        if not (account.report_cache or account.cache):
+            return
+        key = self.cache_key()
+        ttl = self.cache_ttl()
+        if account.cache:
+            account.cache.set(key, self.unprocessed_response, ttl)
+        if account.report_cache:
+            account.report_cache.set(key, self.processed_response, ttl)
+
+    def finish(self, response):
+        """ Store the response of a finished report """
+        self.status = self.STATUSES[2]
+        self.release_slot()
+        self.unprocessed_response = response
+        self.processed_response = self.report(response, self)
+
+    def acquire_slot(self, block=True):
+        """ Take a queue slot from the account, if it limits them """
+        governor = self.suite.account.governor
+        if governor is not None and not self.slot:
+            governor.acquire(block)
+            self.slot = True
+
+    def release_slot(self):
+        """ Hand the queue slot back once the report has left the queue """
+        if self.slot:
+            self.slot = False
+            self.suite.account.governor.release()
+
     def probe(self, heartbeat=None, interval=1, soak=False):
         """ Keep checking until the report is done"""
         # Loop until the report is done
-        while self.is_ready() is False:
+        while self.poll() is False:
             if heartbeat:
                 heartbeat()
             time.sleep(interval)
             # Use a back off up to 30 seconds to play nice with the APIs
-            if interval < 1:
-                interval = 1
-            elif interval < 30:
-                interval = round(interval * 1.5)
-            else:
-                interval = 30
+            interval = utils.backoff(interval)
             self.log.debug("Check Interval: %s seconds", interval)
 
+    def poll(self):
+        """ Like `is_ready`, but a check that keeps failing for transient
+        reasons counts as not ready, so the report id isn't lost """
+        try:
+            return self.is_ready()
+        except TransientError as e:
+            self.log.warning("Couldn't check on report %s: %s", self.id, e)
+            return False
+
     def is_ready(self):
         """ inspects the response to see if the report is ready """
         if self.status == self.STATUSES[0]:
@@ -332,24 +438,31 @@ class Query(object):
                 response = self.suite.request(
                     'Report', 'Get', {'reportID': self.id}
                 )
-                self.status = self.STATUSES[2]
-                self.unprocessed_response = response
-                self.processed_response = self.report(response, self)
+                self.finish(response)
+                self.to_cache()
                 return True
             except reports.ReportNotReadyError:
                 self.status = self.STATUSES[1]
                 # raise reports.InvalidReportError(response)
                 return False
+            except reports.InvalidReportError:
+                self.release_slot()
+                raise
         elif self.status == self.STATUSES[2]:
             return True
 
     def sync(self, heartbeat=None, interval=0.01):
         """ Run the report synchronously,"""
-        if self.status == self.STATUSES[0]:
-            self.queue()
-            self.probe(heartbeat, interval)
-        if self.status == self.STATUSES[1]:
-            self.probe()
+        try:
+            if self.status == self.STATUSES[0]:
+                self.queue()
+                self.probe(heartbeat, interval)
+            if self.status == self.STATUSES[1]:
+                self.probe()
+        except:
+            # nothing is going to wait on the report anymore
+            self.release_slot()
+            raise
         return self.processed_response
 
     def async(self, callback=None, heartbeat=None, interval=1):
@@ -376,6 +489,16 @@ class Query(object):
 
         return self.sync(rheartbeat, interval)
 
+    def write_csv(self, fp, heartbeat=None, interval=0.01, **kwargs):
+        """ Run the report and stream its rows to `fp` as CSV, see
+        `Report.write_csv` """
+        return self.sync(heartbeat, interval).write_csv(fp, **kwargs)
+
+    def write_jsonl(self, fp, heartbeat=None, interval=0.01):
+        """ Run the report and stream its rows to `fp` as JSON lines, see
+        `Report.write_jsonl` """
+        return self.sync(heartbeat, interval).write_jsonl(fp)
+
     def heartbeat(self):
         """ A default heartbeat method that prints a dot for each request """
         sys.stdout.write('.')
@@ -389,11 +512,13 @@ class Query(object):
 
     def cancel(self):
         """ Cancels a the report from the Queue on the Adobe side. """
-        return self.suite.request(
+        response = self.suite.request(
             'Report',
             'CancelReport',
             {'reportID': self.id}
         )
+        self.release_slot()
+        return response
 
     def json(self):
         """ Return a JSON string of the Request """
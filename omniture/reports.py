@@ -2,10 +2,15 @@
 from __future__ import absolute_import
 from __future__ import print_function
 
+import collections
+import csv
 import logging
+import sys
+from array import array
 from datetime import datetime
 import json
 
+from omniture import utils
 from omniture.elements import Value
 
 
@@ -39,7 +44,159 @@ class ReportNotReadyError(Exception):
         super(ReportNotReadyError, self).__init__("Report Not Ready")
 
 
-#  TODO: also make this iterable (go through rows)
+def _fractional(rows, positions):
+    """ Return which of the count `positions` have a count that isn't a
+    whole number in some leaf row """
+    fractional = set()
+    positions = list(positions)
+    stack = [rows]
+    while stack and positions:
+        for row in stack.pop():
+            breakdown = row.get('breakdown')
+            if breakdown:
+                stack.append(breakdown)
+                continue
+            counts = row.get('counts') or ()
+            for position in positions:
+                if position >= len(counts) or counts[position] is None:
+                    continue
+                try:
+                    int(counts[position])
+                except ValueError:
+                    fractional.add(position)
+            if fractional:
+                positions = [position for position in positions
+                             if position not in fractional]
+    return fractional
+
+
+def _parse_counts(counts, kind):
+    """ Parse a whole column of counts at once """
+    if None in counts:
+        return [None if count is None else kind(count) for count in counts]
+    return list(map(kind, counts))
+
+
+def _name_value(row):
+    try:
+        return (str(row['name']), )
+    # If the name value is Null or non-encodable value, return null
+    except:
+        return ("null", )
+
+
+def _datetime_values(row):
+    return (
+        datetime(
+            int(row.get('year', 0)),
+            int(row.get('month', 0)),
+            int(row.get('day', 0)),
+            int(row.get('hour', 0))
+        ),
+        str(row['name'])
+    )
+
+
+class EncodedColumn(object):
+    """ A column kept as a code for every row and a table of the distinct
+    values the codes point to. Rows without a value have the code -1. """
+    def __init__(self):
+        self.codes = array('i')
+        self.values = []
+        self.lookup = {}
+
+    def encode(self, value):
+        """ Return the code of `value`, adding it to the table if needed """
+        if value is None:
+            return -1
+        code = self.lookup.get(value)
+        if code is None:
+            code = self.lookup[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def decode(self):
+        """ Return the column as a list of values """
+        values = self.values + [None]
+        return list(map(values.__getitem__, self.codes))
+
+    def take(self, np, table):
+        """ Return `table` (the values as a NumPy array, with a missing value
+        at the end) picked out by the codes """
+        return table[np.asarray(self.codes)]
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self):
+        return iter(self.decode())
+
+
+def _encoder(parse, coders):
+    """ Wrap the parse function of a level so it returns codes for the
+    values that have an `EncodedColumn` in `coders`. The same names come up
+    over and over, so when only the name matters their codes are looked up
+    by the name as it is in the response. """
+    def encode(row):
+        return tuple([
+            value if coder is None else coder.encode(value)
+            for coder, value in zip(coders, parse(row))])
+
+    if parse is not _name_value:
+        return encode
+
+    names = {}
+
+    def encode_name(row):
+        name = row.get('name')
+        try:
+            return names[name]
+        except KeyError:
+            codes = names[name] = encode(row)
+            return codes
+        except TypeError:
+            return encode(row)
+    return encode_name
+
+
+def _column_size(column, parsed=False):
+    """ Estimate the memory used by a column without going through it. The
+    values are shared with the response, unless they are `parsed`. """
+    if isinstance(column, EncodedColumn):
+        return sys.getsizeof(column.codes) + sys.getsizeof(column.values)
+    size = sys.getsizeof(column)
+    if parsed and column:
+        size += len(column) * sys.getsizeof(column[0])
+    return size
+
+
+def _isoformat(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError("{0!r} is not JSON serializable".format(value))
+
+
+def _datetime_array(np, column):
+    """ Convert the periods of a datetime column to datetime64 once each,
+    then spread them over the rows """
+    table = np.array(column.values + [None], dtype='datetime64[ns]')
+    return column.take(np, table)
+
+
+def _metric_array(np, counts, kind):
+    """ Parse a whole column of counts with NumPy. Ints become int64 unless
+    some rows are missing or they don't fit, then they are float64 like the
+    others. """
+    if None in counts:
+        counts = ['nan' if count is None else count for count in counts]
+    elif kind is int:
+        try:
+            return np.array(counts, dtype='int64')
+        except (ValueError, OverflowError):
+            pass
+    return np.array(counts, dtype='float64')
+
+
 class Report(object):
     """
     Object to parse the responses of the report
@@ -47,6 +204,9 @@ class Report(object):
     To get the data use
     >>> report.data
 
+    To go through the rows without keeping them all in memory use
+    >>> for row in report:
+
     To get a Pandas DataFrame use
     >>> report.dataframe
 
@@ -88,8 +248,12 @@ class Report(object):
             self.segments = None
 
         # Set as none until it is actually used
+        self.column_data = None
+        self.count_data = None
         self.dict_data = None
         self.pandas_data = None
+        self.type_data = None
+        self.raw_size = None
 
     @property
     def data(self):
@@ -99,92 +263,252 @@ class Report(object):
         """
         # If the data hasn't been generate it generate the data
         if self.dict_data is None:
-            self.dict_data = self.parse_rows(self.report['data'])
+            columns = self.columns
+            names = list(columns)
+            self.dict_data = [
+                dict(
+                    (name, value) for name, value in zip(names, values)
+                    if value is not None
+                )
+                for values in zip(*columns.values())
+            ]
+            # the rows hold everything the columns do, keeping both around
+            # would double the memory used. The columns are parsed again
+            # if they are needed later on.
+            self.column_data = None
+            self.count_data = None
 
         return self.dict_data
 
-    def parse_rows(self, row, level=0, upperlevels=None):
+    @property
+    def columns(self):
+        """ Returns the report data as an ordered dict of columns, elements
+            first and metrics last. Rows that don't have a value for a
+            column, such as a top level row without a breakdown, hold None.
         """
-        Parse through the data returned by a repor. Return a list of dicts.
+        if self.column_data is None:
+            types = self.metric_types
+            self.column_data = collections.OrderedDict()
+            for name, column in self._count_columns().items():
+                if name in types:
+                    column = _parse_counts(column, types[name])
+                elif isinstance(column, EncodedColumn):
+                    column = column.decode()
+                self.column_data[name] = column
+
+        return self.column_data
+
+    def _count_columns(self):
+        """ The columns with the counts of the metrics still as strings, so
+        they can be parsed a column at a time. The element values, and the
+        periods of trended reports, are kept once each in a table the rows
+        point to. """
+        if self.count_data is None:
+            types = self.metric_types
+            self.count_data = self.parse_columns(
+                self.report['data'], parse=False,
+                encode=[name for name in self.column_names
+                        if name not in types])
+
+        return self.count_data
+
+    @property
+    def metric_types(self):
+        """ The type of every metric: float if it has decimals or any of
+        its counts is fractional, int otherwise. Rows and columns both go
+        by it, so a metric has the same type throughout the report. """
+        if self.type_data is None:
+            types = collections.OrderedDict(
+                (str(metric.id), float if metric.decimals > 0 else int)
+                for metric in self.metrics
+            )
+            names = list(types)
+            fractional = _fractional(self.report['data'], [
+                position for position, kind in enumerate(types.values())
+                if kind is int])
+            for position in fractional:
+                types[names[position]] = float
+            self.type_data = types
+
+        return self.type_data
+
+    def _element_name(self, element):
+        if hasattr(element, 'classification'):
+            # handle the case where there are multiple classifications
+            return str(element.id) + ' | ' + str(element.classification)
+        else:
+            return str(element.id)
+
+    def _levels(self):
+        """ The columns each level of the data fills in, and how """
+        elements = list(self.elements)
+        if self.type == "trended":
+            # datetime isn't in the elements list for trended reports
+            names = ["datetime"] + [
+                self._element_name(element) for element in elements]
+        else:
+            names = [self._element_name(element) for element in elements]
+        return [
+            (("datetime", "datetime_friendly"), _datetime_values)
+            if name == "datetime" else ((name, ), _name_value)
+            for name in names
+        ]
+
+    def _metric_parsers(self):
+        """ How to parse the counts of each metric, one at a time """
+        return list(self.metric_types.values())
 
-        This method is recursive.
+    @property
+    def column_names(self):
+        """ The names of the columns, elements first and metrics last """
+        levels, names, keep = self._layout()
+        return [names[index] for index in keep]
+
+    def _layout(self):
+        """ The levels of the data and the names of the values every leaf
+        row has, along with the positions of the values to keep """
+        levels = self._levels()
+        names = [name for level_names, parse in levels for name in level_names]
+        names += [str(metric.id) for metric in self.metrics]
+        # when the same column comes up at several levels the deepest wins
+        last = dict((name, index) for index, name in enumerate(names))
+        keep = [index for index, name in enumerate(names)
+                if last[name] == index]
+        return levels, names, keep
+
+    def _walk(self, rows, parse=True, encoded=None):
         """
-        # self.log.debug("Level %s, Upperlevels %s, Row Type %s, Row: %s",
-        # level,upperlevels, type(row), row)
-        data = {}
-        data_set = []
-
-        # merge in the upper levels
-        if upperlevels is not None:
-            data.update(upperlevels)
-
-        if type(row) == list:
-            for r in row:
-                # on the first call set add to the empty list
-                pr = self.parse_rows(r, level, data.copy())
-                if type(pr) == dict:
-                    data_set.append(pr)
-                # otherwise add to the existing list
-                else:
-                    data_set.extend(pr)
-
-        # pull out the metrics from the lowest level
-        if type(row) == dict:
-            # pull out any relevant data from the current record
-            # Handle datetime isn't in the elements list for trended reports
-            if level == 0 and self.type == "trended":
-                element = "datetime"
-            elif self.type == "trended":
-                if hasattr(self.elements[level - 1], 'classification'):
-                    # handle the case where there are multiple classifications
-                    element = str(self.elements[level - 1].id) + ' | '
-                    + str(self.elements[level - 1].classification)
-                else:
-                    element = str(self.elements[level - 1].id)
-            else:
-                if hasattr(self.elements[level], 'classification'):
-                    # handle the case where there are multiple classifications
-                    element = str(self.elements[level].id) + ' | '
-                    + str(self.elements[level].classification)
-                else:
-                    element = str(self.elements[level].id)
-
-            if element == "datetime":
-                data[element] = datetime(
-                    int(row.get('year', 0)),
-                    int(row.get('month', 0)),
-                    int(row.get('day', 0)),
-                    int(row.get('hour', 0))
-                )
-                data["datetime_friendly"] = str(row['name'])
+        Walk the data returned by a report depth first, with a stack rather
+        than recursively, and yield a tuple of values (see `column_names`)
+        for every leaf row. The values of the upper levels are parsed once
+        and shared by every row below them. Without `parse` the counts are
+        left as strings. Columns in `encoded`, a dict of `EncodedColumn`
+        by name, get codes in place of their values.
+        """
+        levels, names, keep = self._layout()
+        parsers = self._metric_parsers()
+        # how to parse every level, and its values for rows that don't
+        # reach it
+        parse_levels = []
+        empty = []
+        position = 0
+        for level_names, parse_level in levels:
+            coders = tuple([
+                encoded.get(name) if encoded and index in keep else None
+                for index, name in enumerate(level_names, position)])
+            empty.append(tuple([
+                None if coder is None else -1 for coder in coders]))
+            if coders.count(None) < len(coders):
+                parse_level = _encoder(parse_level, coders)
+            parse_levels.append(parse_level)
+            position += len(level_names)
+        if len(keep) == len(names):
+            keep = None
+        padding = [sum(empty[level + 1:], ())
+                   for level in range(len(levels))]
+        missing = (None, ) * len(parsers)
+
+        # the values of the rows above the current one
+        prefix = [()] * (len(levels) + 1)
+        stack = [(iter(rows), 0)]
+        while stack:
+            rows, level = stack[-1]
+            row = next(rows, None)
+            if row is None:
+                stack.pop()
+                continue
+
+            values = prefix[level] + parse_levels[level](row)
+            breakdown = row.get('breakdown')
+            if breakdown:
+                prefix[level + 1] = values
+                stack.append((iter(breakdown), level + 1))
+                continue
+
+            counts = row.get('counts') or ()
+            if parse:
+                counts = tuple([
+                    None if count is None else parser(count)
+                    for parser, count in zip(parsers, counts)])
             else:
-                try:
-                    data[element] = str(row['name'])
-
-                # If the name value is Null or non-encodable value, return null
-                except:
-                    data[element] = "null"
-            # parse out any breakdowns and add to the data set
-            if 'breakdown' in row and len(row['breakdown']) > 0:
-                data_set.extend(
-                    self.parse_rows(row['breakdown'], level + 1, data)
-                )
-            elif 'counts' in row:
-                for index, metric in enumerate(row['counts']):
-                        # decide what type of event
-                        if (
-                            self.metrics[index].decimals > 0 or metric.find(
-                                '.'
-                            ) > -1
-                        ):
-                            data[str(self.metrics[index].id)] = float(metric)
-                        else:
-                            data[str(self.metrics[index].id)] = int(metric)
-
-        if len(data_set) > 0:
-            return data_set
+                counts = tuple(counts[:len(parsers)])
+            values += padding[level] + counts + missing[len(counts):]
+            if keep is not None:
+                values = tuple([values[index] for index in keep])
+            yield values
+
+    def parse_columns(self, rows, parse=True, encode=()):
+        """
+        Parse through the data returned by a report. Returns an ordered
+        dict of columns with a value for every leaf row. Without `parse`
+        the counts of the metrics are left as strings. The columns named
+        in `encode` are returned as an `EncodedColumn`.
+        """
+        names = self.column_names
+        encoded = dict((name, EncodedColumn())
+                       for name in encode if name in names)
+        columns = collections.OrderedDict(
+            (name, encoded[name] if name in encoded else [])
+            for name in names)
+        lists = [column.codes if name in encoded else column
+                 for name, column in columns.items()]
+        for values in self._walk(rows, parse, encoded):
+            for column, value in zip(lists, values):
+                column.append(value)
+        return columns
+
+    def iter_rows(self, columns=None):
+        """ Yield the rows as dicts straight from the response, without
+        keeping them around. `columns` limits the rows to those columns. """
+        names = self.column_names
+        if columns is None:
+            picks = list(enumerate(names))
         else:
-            return data
+            picks = []
+            for name in columns:
+                if name not in names:
+                    raise KeyError("Cannot find {0} among the columns: {1}"
+                                   .format(name, ", ".join(names)))
+                picks.append((names.index(name), name))
+
+        for values in self._walk(self.report['data']):
+            yield dict(
+                (name, values[index]) for index, name in picks
+                if values[index] is not None
+            )
+
+    def __iter__(self):
+        return self.iter_rows()
+
+    def write_csv(self, fp, header=True, **kwargs):
+        """ Stream the rows to `fp` as CSV, with a column for every element
+        and metric in the order of `column_names`. Missing values are left
+        empty. Keyword arguments are passed on to `csv.writer`. Returns the
+        number of rows written.
+
+        On Python 3 open the file with newline=''.
+        """
+        writer = csv.writer(fp, **kwargs)
+        if header:
+            writer.writerow(self.column_names)
+        count = 0
+        for values in self._walk(self.report['data']):
+            writer.writerow(values)
+            count += 1
+        return count
+
+    def write_jsonl(self, fp):
+        """ Stream the rows to `fp` as JSON lines, with every element and
+        metric in the order of `column_names`. Missing values are null and
+        datetimes are written in ISO 8601. Returns the number of rows
+        written. """
+        names = self.column_names
+        count = 0
+        for values in self._walk(self.report['data']):
+            row = collections.OrderedDict(zip(names, values))
+            fp.write(json.dumps(row, default=_isoformat) + '\n')
+            count += 1
+        return count
 
     @property
     def dataframe(self):
@@ -201,8 +525,56 @@ class Report(object):
         return self.pandas_data
 
     def to_dataframe(self):
+        """ Build a DataFrame straight from the columns: metrics are int64
+        or float64 depending on their decimals and parsed by NumPy a column
+        at a time, datetime is datetime64 and element values are
+        categorical """
+        import numpy as np
         import pandas as pd
-        return pd.DataFrame.from_dict(self.data)
+
+        types = self.metric_types
+        frame = collections.OrderedDict()
+        for name, column in self._count_columns().items():
+            if name in types:
+                frame[name] = _metric_array(np, column, types[name])
+            elif name == "datetime":
+                frame[name] = _datetime_array(np, column)
+            else:
+                frame[name] = pd.Categorical.from_codes(
+                    np.asarray(column.codes), categories=column.values)
+        return pd.DataFrame(frame, columns=list(frame))
+
+    def to_arrow(self):
+        """ Build a pyarrow Table straight from the columns: metrics are
+        int64 or float64, datetime is a timestamp and element values are
+        dictionary encoded """
+        import numpy as np
+        import pyarrow as pa
+
+        types = self.metric_types
+        columns = self._count_columns()
+        arrays = []
+        for name, column in columns.items():
+            if name in types:
+                # missing counts are NaN in the array and null in the table
+                arrays.append(pa.array(
+                    _metric_array(np, column, types[name]), from_pandas=True))
+            elif name == "datetime":
+                arrays.append(pa.array(
+                    _datetime_array(np, column).astype('datetime64[us]'),
+                    from_pandas=True))
+            else:
+                codes = np.asarray(column.codes)
+                arrays.append(pa.DictionaryArray.from_arrays(
+                    pa.array(codes, mask=codes == -1),
+                    pa.array(column.values, type=pa.string())))
+        return pa.Table.from_arrays(arrays, names=list(columns))
+
+    def to_parquet(self, path, **kwargs):
+        """ Write the report to a Parquet file. Keyword arguments are passed
+        on to `pyarrow.parquet.write_table`. """
+        import pyarrow.parquet as pq
+        pq.write_table(self.to_arrow(), path, **kwargs)
 
     def __init__(self, raw, query):
         self.log = logging.getLogger(__name__)
@@ -211,6 +583,26 @@ class Report(object):
         self.suite = query.suite
         self.process()
 
+    def __sizeof__(self):
+        """ Approximate memory used by the report: the size of the response
+        body, plus whatever has been built from it so far. Responses that
+        didn't come straight from the API are measured once. """
+        if self.raw_size is None:
+            self.raw_size = getattr(self.raw, 'size', None) or \
+                utils.sizeof(self.raw)
+        size = object.__sizeof__(self) + self.raw_size
+        for column in (self.count_data or {}).values():
+            size += _column_size(column)
+        types = self.type_data or {}
+        for name, column in (self.column_data or {}).items():
+            size += _column_size(column, parsed=name in types)
+        if self.dict_data:
+            size += sys.getsizeof(self.dict_data) + \
+                len(self.dict_data) * sys.getsizeof(self.dict_data[0])
+        if self.pandas_data is not None:
+            size += int(self.pandas_data.memory_usage(index=True).sum())
+        return size
+
     def __repr__(self):
         info = {
             'metrics': ", ".join(map(str, self.metrics)),
@@ -0,0 +1,190 @@
+from __future__ import absolute_import
+from __future__ import division
+
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.packages.urllib3.exceptions import ConnectTimeoutError
+
+# methods without side effects, which are safe to send again whatever
+# happened to the first attempt
+READ_ONLY_METHODS = frozenset([
+    'Company.GetEndpoint',
+    'Company.GetReportSuites',
+    'Company.GetTrackingServer',
+    'Company.GetVersionAccess',
+    'Report.Get',
+    'Report.GetElements',
+    'Report.GetMetrics',
+    'Report.GetQueue',
+    'Report.Validate',
+    'Segments.Get',
+])
+
+
+class InvalidResponseError(ValueError):
+    """ Exception raised when the API answers with something that isn't
+        JSON
+    """
+    def __init__(self, error):
+        self.log = logging.getLogger(__name__)
+        self.error = error
+        super(InvalidResponseError, self).__init__(
+            "Response isn't JSON: {0}".format(error))
+
+
+class TransientError(Exception):
+    """ Exception raised when a request keeps failing for reasons that have
+        nothing to do with the request itself (connection problems, server
+        errors, garbled responses). The original exception is kept as
+        `error`.
+    """
+    def __init__(self, error):
+        self.log = logging.getLogger(__name__)
+        self.error = error
+        super(TransientError, self).__init__(
+            "Request failed: {0!r}".format(error))
+
+
+class CircuitOpenError(TransientError):
+    """ Exception raised instead of making a request while the API is
+        considered down
+    """
+    def __init__(self, retry_in):
+        self.log = logging.getLogger(__name__)
+        self.error = None
+        self.retry_in = retry_in
+        Exception.__init__(
+            self, "API unavailable, retrying in {0:.0f} seconds"
+            .format(retry_in))
+
+
+class RetryPolicy(object):
+    """ Decides which failures are worth retrying and how long to wait
+
+    * retries -- how many times to retry a failed request
+    * backoff -- the base delay, doubled after every attempt
+    * max_backoff -- the longest delay between attempts
+    * jitter -- pick a random delay between zero and the backoff so
+        clients that failed together don't retry together
+    * statuses -- HTTP status codes that are considered transient
+    * read_only -- the methods that are retried whatever went wrong.
+        Other methods, such as `Report.Queue`, have side effects and are
+        only retried when the request never reached the API.
+    """
+    def __init__(self, retries=3, backoff=0.5, max_backoff=30, jitter=True,
+                 statuses=(500, 502, 503, 504), read_only=READ_ONLY_METHODS):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.statuses = statuses
+        self.read_only = read_only
+
+    def delay(self, attempt):
+        """ Seconds to wait before retry number `attempt` (from 0) """
+        delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+    def check(self, response):
+        """ Raise for status codes that are worth retrying """
+        if response.status_code in self.statuses:
+            response.raise_for_status()
+
+    def is_transient(self, error):
+        if isinstance(error, requests.HTTPError):
+            return error.response is not None and \
+                error.response.status_code in self.statuses
+        return isinstance(error, (
+            requests.ConnectionError, requests.Timeout,
+            requests.exceptions.ChunkedEncodingError, InvalidResponseError))
+
+    def is_unsent(self, error):
+        """ Whether the request failed before it was sent, while connecting
+        """
+        if isinstance(error, requests.ConnectTimeout):
+            return True
+        if not isinstance(error, requests.ConnectionError) or not error.args:
+            return False
+        # requests wraps the urllib3 error, which has the original reason
+        reason = getattr(error.args[0], 'reason', error.args[0])
+        return isinstance(reason, ConnectTimeoutError)
+
+    def can_retry(self, error, method):
+        """ Whether a transient `error` of `method` (such as
+        'Report.Queue') can be retried without doing things twice """
+        return method in self.read_only or self.is_unsent(error)
+
+    def __repr__(self):
+        return "<RetryPolicy: {0} retries>".format(self.retries)
+
+
+class CircuitBreaker(object):
+    """ Fails fast while the API is down
+
+    After `threshold` transient failures in a row the circuit opens and
+    requests fail with `CircuitOpenError` without being sent. Once
+    `reset_timeout` seconds have passed a single trial request is let
+    through: if it works the circuit closes again, if not it stays open
+    for another `reset_timeout`.
+    """
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.log = logging.getLogger(__name__)
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    def before(self):
+        """ Raise `CircuitOpenError` if a request shouldn't go out,
+        return whether the request is the trial """
+        with self.lock:
+            if self.opened is None:
+                return False
+            retry_in = self.opened + self.reset_timeout - time.time()
+            if retry_in > 0 or self.trial:
+                raise CircuitOpenError(max(retry_in, 0))
+            self.trial = True
+            return True
+
+    def cancel(self):
+        """ Give up on the trial request when it ended without telling
+        whether the API is back, so another one can be let through """
+        with self.lock:
+            self.trial = False
+
+    def success(self):
+        with self.lock:
+            if self.opened is not None:
+                self.log.info("API is back, closing the circuit")
+            self.failures = 0
+            self.opened = None
+            self.trial = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.threshold:
+                if self.opened is None or self.trial:
+                    self.log.warning("API is failing, opening the circuit")
+                self.opened = time.time()
+                self.trial = False
+
+    @property
+    def state(self):
+        if self.opened is None:
+            return "closed"
+        elif self.trial:
+            return "half-open"
+        else:
+            return "open"
+
+    def __repr__(self):
+        return "<CircuitBreaker: {0}>".format(self.state)
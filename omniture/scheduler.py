@@ -0,0 +1,185 @@
+# encoding: utf-8
+from __future__ import absolute_import
+
+import collections
+import heapq
+import itertools
+import logging
+import time
+
+from omniture import utils
+from omniture.retry import TransientError
+from omniture.throttle import QueueFullError
+
+
+class Scheduler(object):
+    """ Poll a batch of queries in a single loop
+
+    Instead of waiting on each query in turn, the scheduler keeps every
+    pending query on a timeline and checks whichever one is due next,
+    each with its own back off. Finished reports are handed out as soon
+    as Adobe has them, so a slow report doesn't hold up the rest.
+
+    * queries -- a list or a dictionary of queries
+    * heartbeat (optional) -- called every time the scheduler goes to
+        sleep while reports are still pending
+    * interval (optional) -- the initial polling interval, which backs off
+        for each query independently (see `utils.backoff`)
+    * bulk (optional) -- check on pending reports with a single
+        `Report.GetQueue` call per account and only fetch the reports that
+        have left the queue, instead of a `Report.Get` per report
+    """
+    def __init__(self, queries, heartbeat=None, interval=1, bulk=False):
+        self.log = logging.getLogger(__name__)
+        if isinstance(queries, list):
+            self.queries = list(enumerate(queries))
+        elif isinstance(queries, dict):
+            self.queries = list(queries.items())
+        else:
+            message = (
+                "Queries should be a list or a dictionary, received: {}"
+                .format(queries.__class__)
+            )
+            raise ValueError(message)
+        self.heartbeat = heartbeat
+        self.interval = interval
+        self.bulk = bulk
+        self.counter = itertools.count()
+        self.timeline = []
+        # queries waiting for room in the queue, by account
+        self.backlogs = collections.OrderedDict()
+
+    def backlog(self, queries):
+        """ Put `queries` in the backlog of their account """
+        for key, query in queries:
+            account = query.suite.account
+            if account not in self.backlogs:
+                self.backlogs[account] = collections.deque()
+            self.backlogs[account].append((key, query))
+
+    def pending(self):
+        """ The number of queries that aren't done yet """
+        return len(self.timeline) + sum(map(len, self.backlogs.values()))
+
+    def queue(self):
+        """ Queue the queries that haven't been submitted yet, for as long
+        as their account has room in its queue. The rest stays in the
+        backlog until a report on the same account finishes. """
+        for account, backlog in list(self.backlogs.items()):
+            while backlog:
+                key, query = backlog[0]
+                if query.status == query.STATUSES[0]:
+                    try:
+                        query.queue(block=False)
+                    except QueueFullError:
+                        break
+                backlog.popleft()
+                self.schedule(key, query, 0, self.interval)
+            if not backlog:
+                del self.backlogs[account]
+
+    def schedule(self, key, query, delay, interval):
+        due = time.time() + delay
+        heapq.heappush(
+            self.timeline, (due, next(self.counter), key, query, interval))
+
+    def sleep(self):
+        """ Sleep until the next query is due """
+        if self.heartbeat:
+            self.heartbeat()
+        if self.timeline:
+            delay = self.timeline[0][0] - time.time()
+        else:
+            # waiting on queue slots held elsewhere
+            delay = self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+    def due(self):
+        """ Take every query that is due off the timeline """
+        entries = []
+        now = time.time()
+        while self.timeline and self.timeline[0][0] <= now:
+            entries.append(heapq.heappop(self.timeline))
+        return entries
+
+    def queued(self, entries):
+        """ Ask each account with a report in `entries` which reports are
+        still in the queue. Reports on those accounts that have left the
+        queue are taken off the timeline and added to `entries` so they get
+        picked up right away. """
+        accounts = set(
+            query.suite.account for due, _, key, query, interval in entries
+            if query.status == query.STATUSES[1]
+        )
+        queued = set()
+        for account in list(accounts):
+            try:
+                queued.update(account.queued_reports())
+            except TransientError as e:
+                # check again on the next tick
+                self.log.warning("Couldn't check the report queue: %s", e)
+                accounts.discard(account)
+                queued.update(
+                    str(entry[3].id) for entry in entries
+                    if entry[3].suite.account is account
+                )
+
+        waiting = []
+        for entry in self.timeline:
+            query = entry[3]
+            if query.suite.account in accounts and \
+                    str(query.id) not in queued:
+                entries.append(entry)
+            else:
+                waiting.append(entry)
+        self.timeline = waiting
+        heapq.heapify(self.timeline)
+        return queued
+
+    def poll(self):
+        """ Check every query that is due, return the finished ones """
+        finished = []
+        entries = self.due()
+        queued = self.queued(entries) if self.bulk else set()
+        for due, _, key, query, interval in entries:
+            if str(query.id) not in queued and query.poll():
+                finished.append((key, query.processed_response))
+            else:
+                self.schedule(key, query, interval, utils.backoff(interval))
+        return finished
+
+    def release(self):
+        """ Hand back the queue slots the queries still hold """
+        for key, query in self.queries:
+            query.release_slot()
+
+    def __iter__(self):
+        """ Yield `(key, report)` pairs in the order they finish. The key is
+        the index of the query for lists and its key for dictionaries. """
+        self.backlogs.clear()
+        self.backlog(self.queries)
+        try:
+            self.queue()
+            while self.pending():
+                for result in self.poll():
+                    yield result
+                self.queue()
+                if self.pending():
+                    self.sleep()
+                self.log.debug("Reports still pending: %s", self.pending())
+        except:
+            # nobody is going to wait on these reports anymore
+            self.release()
+            raise
+
+
+def as_completed(queries, heartbeat=None, interval=1, bulk=False):
+    """
+    Queue a list or a dictionary of queries and yield `(key, report)`
+    pairs as soon as each report is ready.
+
+        for key, report in omniture.as_completed(queries):
+            print(key, report.data)
+    """
+    return iter(Scheduler(queries, heartbeat, interval, bulk))
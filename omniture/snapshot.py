@@ -0,0 +1,68 @@
+# encoding: utf-8
+"""
+Snapshots of an account's metadata: its report suites and the metrics,
+elements and segments of each of them, as one compact JSON file (gzipped
+when the file name ends in .gz). An account created from a snapshot
+doesn't need the API until it runs a report:
+
+    omniture.authenticate(os.environ).save_snapshot('metadata.json.gz')
+    ...
+    analytics = omniture.authenticate(os.environ, snapshot='metadata.json.gz')
+"""
+from __future__ import absolute_import
+
+import gzip
+import io
+import json
+import time
+
+VERSION = 1
+NAMES = ('metrics', 'elements', 'segments')
+
+
+class SnapshotError(Exception):
+    """ Exception raised when a snapshot can't be read """
+    def __init__(self, path, reason):
+        self.path = path
+        super(SnapshotError, self).__init__(
+            "Can't read snapshot {0}: {1}".format(path, reason))
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode)
+    return io.open(path, mode)
+
+
+def save(account, path, suites=None, names=NAMES):
+    """ Write the metadata of `suites` (every report suite by default) to
+    `path`, fetching whatever hasn't been loaded yet """
+    if suites is None:
+        suites = account.suites
+    snapshot = {
+        'version': VERSION,
+        'created': time.time(),
+        'suites': [
+            {
+                'rsid': suite.id,
+                'site_title': suite.title,
+                'metadata': dict((name, suite.rows(name)) for name in names),
+            }
+            for suite in suites
+        ],
+    }
+    data = json.dumps(snapshot, separators=(',', ':'))
+    with _open(path, 'wb') as fp:
+        fp.write(data.encode('utf-8'))
+
+
+def load(path):
+    """ Read a snapshot written by `save` """
+    try:
+        with _open(path, 'rb') as fp:
+            snapshot = json.loads(fp.read().decode('utf-8'))
+    except (IOError, ValueError) as e:
+        raise SnapshotError(path, e)
+    if not isinstance(snapshot, dict) or snapshot.get('version') != VERSION:
+        raise SnapshotError(path, "unsupported version")
+    return snapshot
@@ -0,0 +1,83 @@
+from __future__ import absolute_import
+from __future__ import division
+
+import logging
+import threading
+import time
+
+
+class QueueFullError(Exception):
+    """ Exception raised when a report can't be queued without waiting
+        because the account already has as many reports queued as allowed
+    """
+    def __init__(self, limit):
+        self.log = logging.getLogger(__name__)
+        self.log.debug("Report queue is full")
+        super(QueueFullError, self).__init__(
+            "Already {0} reports in the queue".format(limit))
+
+
+class TokenBucket(object):
+    """ Thread-safe token bucket rate limiter
+
+    * rate -- the number of requests allowed per second on average
+    * burst (optional) -- how many requests can be sent back to back
+        after a quiet period. Defaults to one second worth of requests.
+    """
+    def __init__(self, rate, burst=None):
+        self.log = logging.getLogger(__name__)
+        self.rate = float(rate)
+        self.burst = float(burst or max(rate, 1))
+        self.tokens = self.burst
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = max(now - self.updated, 0)
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens=1):
+        """ Take `tokens` if they are available and return 0, otherwise
+        return the seconds to wait before trying again """
+        with self.lock:
+            self._refill(time.time())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0
+            return (tokens - self.tokens) / self.rate
+
+    def acquire(self, tokens=1):
+        """ Block until `tokens` requests can be sent """
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return
+            self.log.debug("Rate limited, waiting %.3f seconds", wait)
+            time.sleep(wait)
+
+    def __repr__(self):
+        return "<TokenBucket: {0}/s burst {1}>".format(self.rate, self.burst)
+
+
+class QueueGovernor(object):
+    """ Caps the number of reports an account has queued at the same time
+
+    A slot is taken when a report is queued and handed back when the report
+    is done, fails or is cancelled.
+    """
+    def __init__(self, limit):
+        self.limit = limit
+        self.semaphore = threading.BoundedSemaphore(limit)
+
+    def acquire(self, block=True):
+        """ Take a slot, raises `QueueFullError` if there is none and
+        `block` is False """
+        if not self.semaphore.acquire(block):
+            raise QueueFullError(self.limit)
+
+    def release(self):
+        self.semaphore.release()
+
+    def __repr__(self):
+        return "<QueueGovernor: {0} reports>".format(self.limit)
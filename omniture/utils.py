@@ -2,6 +2,10 @@ from __future__ import absolute_import
 
 from copy import copy
 import datetime
+import hashlib
+import json
+import sys
+import threading
 from dateutil.parser import parse as parse_date
 import six
 
@@ -19,31 +23,194 @@ class memoize:
             return self.memoized[args]
 
 
+class SingleFlight(object):
+    """ Coalesce identical calls that are in flight at the same time
+
+    The first caller for a key runs the function, everyone who asks for the
+    same key before it returns waits for that call and gets the same result
+    (or exception). Results are shared, so treat them as read-only.
+    """
+    class Call(object):
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.exc_info = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, function, *args, **kwargs):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = self.Call()
+
+        if not leader:
+            call.done.wait()
+            if call.exc_info is not None:
+                six.reraise(*call.exc_info)
+            return call.result
+
+        try:
+            call.result = function(*args, **kwargs)
+            return call.result
+        except BaseException:
+            call.exc_info = sys.exc_info()
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+
+class Interner(object):
+    """ Keep a single copy of equal rows and tables of JSON data
+
+    Report suites of the same company mostly return the same metrics,
+    elements and segments. Passing their responses through `table` makes
+    equal rows the same object, and equal tables the same list, so memory
+    grows with the number of distinct definitions rather than with the
+    number of report suites. Interned data is shared, treat it as
+    read-only.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rows = {}
+        self.tables = {}
+
+    @staticmethod
+    def digest(value):
+        canonical = json.dumps(value, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha1(canonical.encode('utf-8')).digest()
+
+    def table(self, rows):
+        """ Return `rows` with every row replaced by its interned copy, or
+        the interned copy of the whole table """
+        if not isinstance(rows, list):
+            return rows
+        digests = [self.digest(row) for row in rows]
+        key = hashlib.sha1(b''.join(digests)).digest()
+        with self.lock:
+            if key not in self.tables:
+                self.tables[key] = [
+                    self.rows.setdefault(digest, row)
+                    for digest, row in zip(digests, rows)
+                ]
+            return self.tables[key]
+
+    def __repr__(self):
+        return "<Interner: {0} rows in {1} tables>".format(
+            len(self.rows), len(self.tables))
+
+
 class AddressableList(list):
-    """ List of items addressable either by id or by name """
+    """ List of items addressable either by id or by name
+
+    Lookups by id or name go through an index that is built on first use.
+    Appending keeps it up to date, other changes to the list rebuild it on
+    the next lookup. Changing the title or id of an item already in the
+    list isn't noticed.
+    """
+    _index = None
+
     def __init__(self, items, name='items'):
         super(AddressableList, self).__init__(items)
         self.name = name
+        self._index = None
+
+    def _item(self, position):
+        return super(AddressableList, self).__getitem__(position)
+
+    def _index_keys(self, position):
+        """ The keys the item at `position` can be looked up by """
+        item = self._item(position)
+        return (item.title, item.id)
+
+    def _add_to_index(self, index, position):
+        for key in set(self._index_keys(position)):
+            index.setdefault(key, []).append(position)
+
+    def _get_index(self):
+        index = self._index
+        if index is None:
+            index = {}
+            for position in range(len(self)):
+                self._add_to_index(index, position)
+            self._index = index
+        return index
+
+    def _invalidate(self):
+        self._index = None
+
+    def __getstate__(self):
+        # copies and pickles build their own index, appending to a shared
+        # one would change what the original list finds
+        state = self.__dict__.copy()
+        state.pop('_index', None)
+        return state
 
     def __getitem__(self, key):
-        if isinstance(key, int):
+        if isinstance(key, (int, slice)):
             return super(AddressableList, self).__getitem__(key)
+        try:
+            positions = self._get_index().get(key, ())
+        except TypeError:
+            # unhashable keys can't match anything
+            positions = ()
+        count = len(positions)
+        if count > 1:
+            matches = [repr(self._item(position)) for position in positions]
+            error = "Found multiple matches for {key}: {matches}. ".format(
+                key=key, matches=", ".join(matches))
+            advice = "Use the identifier instead."
+            raise KeyError(error + advice)
+        elif count == 1:
+            return self._item(positions[0])
         else:
-            matches = [
-                item for item in self if item.title == key or item.id == key
-            ]
-            count = len(matches)
-            if count > 1:
-                matches = list(map(repr, matches))
-                error = "Found multiple matches for {key}: {matches}. ".format(
-                    key=key, matches=", ".join(matches))
-                advice = "Use the identifier instead."
-                raise KeyError(error + advice)
-            elif count == 1:
-                return matches[0]
-            else:
-                raise KeyError("Cannot find {key} among the available {name}"
-                               .format(key=key, name=self.name))
+            raise KeyError("Cannot find {key} among the available {name}"
+                           .format(key=key, name=self.name))
+
+    def append(self, item):
+        super(AddressableList, self).append(item)
+        if self._index is not None:
+            self._add_to_index(self._index, len(self) - 1)
+
+    def extend(self, items):
+        start = len(self)
+        super(AddressableList, self).extend(items)
+        if self._index is not None:
+            for position in range(start, len(self)):
+                self._add_to_index(self._index, position)
+
+    def __iadd__(self, items):
+        self.extend(items)
+        return self
+
+    def _mutator(name):
+        def mutate(self, *args, **kwargs):
+            try:
+                return getattr(
+                    super(AddressableList, self), name)(*args, **kwargs)
+            finally:
+                self._invalidate()
+        mutate.__name__ = name
+        return mutate
+
+    __setitem__ = _mutator('__setitem__')
+    __delitem__ = _mutator('__delitem__')
+    # Python 2 slices
+    __setslice__ = _mutator('__setslice__')
+    __delslice__ = _mutator('__delslice__')
+    __imul__ = _mutator('__imul__')
+    insert = _mutator('insert')
+    pop = _mutator('pop')
+    remove = _mutator('remove')
+    reverse = _mutator('reverse')
+    sort = _mutator('sort')
+    clear = _mutator('clear')
+    del _mutator
 
     def _repr_html_(self):
         """ HTML formating for iPython users """
@@ -69,6 +236,30 @@ class AddressableList(list):
         return "<AddressableList>"
 
 
+class Response(dict):
+    """ A decoded JSON object response, along with the size of the body it
+    was decoded from in bytes """
+    def __init__(self, data, size):
+        super(Response, self).__init__(data)
+        self.size = size
+
+
+def sizeof(obj):
+    """ Estimate the memory used by a structure of dicts, lists and
+    scalars, such as a decoded JSON response, in bytes """
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+    return size
+
+
 def date(obj):
     # used to ensure compatibility with Python3 without having to user six
     if obj is None:
@@ -94,6 +285,17 @@ def wrap(obj):
         return [obj]
 
 
+def backoff(interval, maximum=30):
+    """ Return the next polling interval. Backs off by 50% at a time up to
+    `maximum` seconds to play nice with the APIs """
+    if interval < 1:
+        return 1
+    elif interval < maximum:
+        return min(round(interval * 1.5), maximum)
+    else:
+        return maximum
+
+
 def affix(prefix=None, base=None, suffix=None, connector='_'):
     if prefix:
         prefix = prefix + connector
@@ -108,6 +310,18 @@ def affix(prefix=None, base=None, suffix=None, connector='_'):
     return prefix + base + suffix
 
 
+def credentials(username, secret=None, prefix='', suffix=''):
+    """ Return a username and secret. If no secret is specified, we will
+    assume that instead we have received a dictionary with credentials (such
+    as from os.environ) """
+    if not secret:
+        source = username
+        username = source[affix(prefix, 'OMNITURE_USERNAME', suffix)]
+        secret = source[affix(prefix, 'OMNITURE_SECRET', suffix)]
+
+    return username, secret
+
+
 def translate(d, mapping):
     d = copy(d)
 
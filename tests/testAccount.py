@@ -4,6 +4,9 @@ import unittest
 import requests_mock
 import omniture
 import os
+import json
+import threading
+import time
 
 creds = {}
 creds['username'] = os.environ['OMNITURE_USERNAME']
@@ -84,6 +87,125 @@ class AccountTest(unittest.TestCase):
         """
         self.assertIsInstance(self.analytics.suites[test_report_suite].elements, omniture.utils.AddressableList)
 
+    @requests_mock.mock()
+    def test_coalesced_requests(self, m):
+        """ Threads loading the same metadata at once share one request """
+        path = os.path.dirname(__file__)
+        with open(path+'/mock_objects/Report.GetMetrics.json') as get_metrics_file:
+            metrics = get_metrics_file.read()
+
+        def slow_metrics(request, context):
+            time.sleep(0.2)
+            return metrics
+
+        m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.GetMetrics', text=slow_metrics)
+        suite = self.analytics.suites['testdev']
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(suite.request('Report', 'GetMetrics')))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(m.call_count, 1)
+        self.assertEqual(len(results), 4)
+
+    @requests_mock.mock()
+    def test_requests_not_coalesced(self, m):
+        """ Methods that do something, such as Data Warehouse requests, are
+        sent every time """
+        def slow_request(request, context):
+            time.sleep(0.2)
+            return '{"reportID": "123456789"}'
+
+        m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.Request', text=slow_request)
+        threads = [threading.Thread(target=lambda: self.analytics.request('Report', 'Request', {}))
+                   for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(m.call_count, 2)
+
+    @requests_mock.mock()
+    def test_lazy(self, m):
+        """ A lazy account only lists its report suites when asked to """
+        path = os.path.dirname(__file__)
+        with open(path+'/mock_objects/Company.GetReportSuites.json') as get_report_suites_file:
+            m.post('https://api.omniture.com/admin/1.4/rest/?method=Company.GetReportSuites',
+                   text=get_report_suites_file.read())
+        with open(path+'/mock_objects/Report.Queue.json') as queue_file:
+            m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.Queue',
+                   text=queue_file.read())
+        analytics = omniture.authenticate(creds['username'], creds['secret'], lazy=True)
+        self.assertEqual(m.call_count, 0)
+
+        query = analytics.jsonReport(json.dumps({'reportDescription': {
+            'reportSuiteID': test_report_suite, 'date': '2016-09-04'}}))
+        self.assertEqual(query.suite.id, test_report_suite)
+        self.assertEqual(m.call_count, 0)
+
+        suite = analytics.suite(test_report_suite)
+        self.assertIs(suite, analytics.suite(test_report_suite))
+        suite.report.metric('pageviews', disable_validation=True).queue()
+        self.assertEqual([r.qs['method'][0] for r in m.request_history], ['report.queue'])
+
+        self.assertIsInstance(analytics.suites[test_report_suite], omniture.account.Suite)
+        analytics.suites
+        self.assertEqual(m.call_count, 2)
+        self.assertIs(analytics.suite(test_report_suite), analytics.suites[test_report_suite])
+
+    @requests_mock.mock()
+    def test_prefetch(self, m):
+        """ Metadata of several report suites is loaded concurrently """
+        path = os.path.dirname(__file__)
+        threads = set()
+
+        def slow(body):
+            def callback(request, context):
+                threads.add(threading.current_thread().ident)
+                time.sleep(0.05)
+                return body
+            return callback
+
+        for name in ['Report.GetMetrics', 'Report.GetElements', 'Segments.Get']:
+            with open(path+'/mock_objects/' + name + '.json') as fp:
+                m.post('https://api.omniture.com/admin/1.4/rest/?method=' + name,
+                       text=slow(fp.read()))
+        suites = [suite for suite in self.analytics.suites if suite.id != test_report_suite]
+        calls = []
+        errors = self.analytics.prefetch(
+            suites, concurrency=4, progress=lambda *args: calls.append(args))
+        self.assertEqual(errors, {})
+        self.assertEqual(len(calls), len(suites) * 3)
+        self.assertEqual(calls[-1][2:], (len(suites) * 3, len(suites) * 3))
+        self.assertGreater(len(threads), 1)
+        requests = m.call_count
+        for suite in suites:
+            suite.metrics
+            suite.elements
+            suite.segments
+        self.assertEqual(m.call_count, requests)
+
+    @requests_mock.mock()
+    def test_interned_metadata(self, m):
+        """ Report suites share the metadata they have in common """
+        path = os.path.dirname(__file__)
+        with open(path+'/mock_objects/Report.GetMetrics.json') as get_metrics_file:
+            metrics = json.loads(get_metrics_file.read())
+        other = [dict(metrics[0], name='Renamed')] + metrics[1:]
+        m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.GetMetrics',
+               [{'text': json.dumps(metrics)}, {'text': json.dumps(other)}])
+        first = self.analytics.suites[test_report_suite].raw['metrics']
+        rows = len(self.analytics.interner.rows)
+        same = omniture.account.Suite('same', 'same', self.analytics).rows('metrics')
+        different = omniture.account.Suite('different', 'different', self.analytics).rows('metrics')
+        self.assertIs(same, first)
+        self.assertIsNot(different[0], first[0])
+        for row, shared in zip(different[1:], first[1:]):
+            self.assertIs(row, shared)
+        self.assertEqual(len(self.analytics.interner.rows), rows + 1)
+
     def test_basic_report(self):
         """ Make sure a basic report can be run
         """
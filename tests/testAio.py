@@ -0,0 +1,281 @@
+#!/usr/bin/python
+
+import unittest
+import omniture
+import io
+import os
+import sys
+import json
+import shutil
+import tempfile
+import threading
+
+try:
+    import asyncio
+    import aiohttp
+    from omniture import aio
+except (ImportError, SyntaxError):
+    aio = None
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from urlparse import urlparse, parse_qs
+
+creds = {}
+creds['username'] = os.environ['OMNITURE_USERNAME']
+creds['secret'] = os.environ['OMNITURE_SECRET']
+test_report_suite = 'omniture.api-gateway'
+mock_objects = os.path.join(os.path.dirname(__file__), 'mock_objects')
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """ Serves the mock objects the way the Adobe API would """
+    def do_POST(self):
+        method = parse_qs(urlparse(self.path).query)['method'][0]
+        length = int(self.headers['Content-Length'])
+        query = json.loads(self.rfile.read(length).decode())
+        self.server.calls.append((method, query))
+
+        if self.server.failures > 0:
+            self.server.failures -= 1
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if method == 'Report.Get' and self.server.not_ready > 0:
+            self.server.not_ready -= 1
+            name = 'Report.Get.NotReady'
+        elif method == 'Report.Get':
+            name = 'basic_report'
+        else:
+            name = method
+
+        with open(os.path.join(mock_objects, name + '.json'), 'rb') as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@unittest.skipIf(aio is None, "asyncio support requires Python 3.5+ and aiohttp")
+class AioTest(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), StandInHandler)
+        self.server.calls = []
+        self.server.not_ready = 0
+        self.server.failures = 0
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.endpoint = 'http://127.0.0.1:{}/'.format(self.server.server_port)
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.loop.close()
+
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def authenticate(self, **kwargs):
+        return self.run_async(aio.authenticate(
+            creds['username'], creds['secret'], endpoint=self.endpoint,
+            **kwargs))
+
+    def close(self, account):
+        self.run_async(account.close())
+
+    def test_authenticate(self):
+        """ Authenticating loads the report suites """
+        account = self.authenticate()
+        self.assertIsInstance(account, aio.AsyncAccount)
+        self.assertIsInstance(account.suites[test_report_suite], aio.AsyncSuite)
+        self.assertEqual(self.server.calls[0][0], 'Company.GetReportSuites')
+        self.close(account)
+
+    def test_load_metadata(self):
+        """ Metrics, elements and segments are loaded with coroutines """
+        account = self.authenticate()
+        suite = account.suites[test_report_suite]
+        with self.assertRaises(aio.MetadataNotLoadedError):
+            suite.metrics
+        self.run_async(suite.load())
+        self.assertIsInstance(suite.metrics, omniture.utils.AddressableList)
+        self.assertIsInstance(suite.elements, omniture.utils.AddressableList)
+        self.assertIsInstance(suite.segments, omniture.utils.AddressableList)
+        methods = sorted(method for method, query in self.server.calls[1:])
+        self.assertEqual(methods, ['Report.GetElements', 'Report.GetMetrics', 'Segments.Get'])
+        self.close(account)
+
+    def test_await_query(self):
+        """ Awaiting a query queues it, polls it and returns the report """
+        self.server.not_ready = 2
+        account = self.authenticate()
+        suite = account.suites[test_report_suite]
+        self.run_async(suite.load('metrics'))
+        query = suite.report.metric('pageviews').range('2016-09-04')
+        self.assertIsInstance(query, aio.AsyncQuery)
+
+        async def run():
+            return await query
+
+        report = self.run_async(run())
+        self.assertIsInstance(report, omniture.reports.Report)
+        self.assertEqual(query.status, "Done")
+        methods = [method for method, q in self.server.calls]
+        self.assertEqual(methods.count('Report.Queue'), 1)
+        self.assertEqual(methods.count('Report.Get'), 3)
+        self.close(account)
+
+    def test_not_submitted(self):
+        """ A query that wasn't queued can't be checked on """
+        account = self.authenticate()
+        query = account.suites[test_report_suite].report
+        with self.assertRaises(omniture.query.ReportNotSubmittedError):
+            self.run_async(query.is_ready())
+        self.close(account)
+
+    def test_sync(self):
+        """ aio.sync runs queries concurrently and keeps the shape """
+        account = self.authenticate()
+        suite = account.suites[test_report_suite]
+        queries = {
+            'a': suite.report.metric('pageviews', disable_validation=True),
+            'b': suite.report.metric('visits', disable_validation=True),
+        }
+        response = self.run_async(aio.sync(queries, interval=0.01))
+        self.assertEqual(sorted(response.keys()), ['a', 'b'])
+        self.assertIsInstance(response['a'], omniture.reports.Report)
+        self.close(account)
+
+    def test_retry(self):
+        """ Read-only requests are retried, queueing a report isn't """
+        retry = omniture.retry.RetryPolicy(retries=2, backoff=0)
+        account = self.authenticate(retry=retry)
+        self.server.failures = 1
+        self.run_async(account.suites[test_report_suite].load('metrics'))
+        self.assertEqual([method for method, q in self.server.calls[1:]],
+                         ['Report.GetMetrics', 'Report.GetMetrics'])
+        self.server.failures = 1
+        query = account.suites[test_report_suite].report\
+            .metric('pageviews', disable_validation=True)
+        with self.assertRaises(omniture.retry.TransientError):
+            self.run_async(query.queue())
+        self.assertEqual(self.server.calls[-1][0], 'Report.Queue')
+        self.assertEqual(len(self.server.calls), 4)
+        self.close(account)
+
+    def test_probe_keeps_report(self):
+        """ Polling carries on through transient failures """
+        retry = omniture.retry.RetryPolicy(retries=0)
+        account = self.authenticate(retry=retry)
+        query = account.suites[test_report_suite].report\
+            .metric('pageviews', disable_validation=True)
+        self.run_async(query.queue())
+        self.server.failures = 1
+        self.run_async(query.probe(interval=0.01))
+        self.assertEqual(query.status, "Done")
+        self.assertEqual(query.id, "123456789")
+        methods = [method for method, q in self.server.calls]
+        self.assertEqual(methods.count('Report.Get'), 2)
+        self.close(account)
+
+    def test_query_coroutines(self):
+        """ Writing and cancelling reports are coroutines too """
+        account = self.authenticate()
+        suite = account.suites[test_report_suite]
+        query = suite.report.metric('pageviews', disable_validation=True)
+        fp = io.StringIO()
+        self.assertEqual(self.run_async(query.write_csv(fp, interval=0.01)), 1)
+        self.assertEqual(fp.getvalue().splitlines()[0],
+                         'datetime,datetime_friendly,pageviews')
+        fp = io.StringIO()
+        self.assertEqual(self.run_async(query.write_jsonl(fp)), 1)
+
+        query = suite.report.metric('pageviews', disable_validation=True)
+        self.run_async(query.queue())
+        self.assertTrue(self.run_async(query.cancel()))
+        self.assertEqual(self.server.calls[-1][0], 'Report.CancelReport')
+        with self.assertRaises(TypeError):
+            getattr(query, 'async')()
+        self.close(account)
+
+    def test_cancelled_trial(self):
+        """ A cancelled trial request doesn't keep the circuit half-open """
+        breaker = omniture.retry.CircuitBreaker(threshold=1, reset_timeout=60)
+        account = self.authenticate(lazy=True, circuit_breaker=breaker)
+        breaker.failure()
+        breaker.opened -= 61
+
+        async def cancelled(*args):
+            raise asyncio.CancelledError()
+
+        account._post = cancelled
+        with self.assertRaises(asyncio.CancelledError):
+            self.run_async(account.request('Company', 'GetReportSuites'))
+        self.assertEqual(breaker.state, "open")
+        del account._post
+        self.run_async(account.request('Company', 'GetReportSuites'))
+        self.assertEqual(breaker.state, "closed")
+        self.close(account)
+
+    def test_coalesce(self):
+        """ Identical requests made at the same time share a response """
+        account = self.authenticate(lazy=True)
+
+        async def load():
+            return await asyncio.gather(
+                account.request('Company', 'GetReportSuites'),
+                account.request('Company', 'GetReportSuites'))
+
+        first, second = self.run_async(load())
+        self.assertIs(first, second)
+        self.assertEqual(len(self.server.calls), 1)
+        self.close(account)
+
+    def test_prefetch(self):
+        """ Metadata is prefetched and saved with coroutines """
+        account = self.authenticate()
+        calls = []
+        errors = self.run_async(account.prefetch(
+            [test_report_suite], concurrency=2,
+            progress=lambda *args: calls.append(args)))
+        self.assertEqual(errors, {})
+        self.assertEqual([call[2:] for call in calls], [(1, 3), (2, 3), (3, 3)])
+        suite = account.suites[test_report_suite]
+        self.assertIsInstance(suite.metrics, omniture.utils.AddressableList)
+
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'metadata.json')
+            self.run_async(account.save_snapshot(path, [test_report_suite]))
+            snapshot = omniture.snapshot.load(path)
+            self.assertEqual(snapshot['suites'][0]['rsid'], test_report_suite)
+        finally:
+            shutil.rmtree(directory)
+
+        queued = self.run_async(account.queued_reports())
+        self.assertIsInstance(queued, set)
+        self.close(account)
+
+    def test_unsupported(self):
+        """ Blocking features can't be turned on """
+        with self.assertRaises(ValueError):
+            aio.AsyncAccount('user', 'secret', cache=True)
+        with self.assertRaises(TypeError):
+            aio.AsyncAccount('user', 'secret', snapshot='metadata.json')
+        aio.AsyncAccount('user', 'secret', cache=False, rate_limit=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,329 @@
+#!/usr/bin/python
+
+import unittest
+import requests_mock
+import omniture
+import os
+import datetime
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from omniture.cache import FileCache, MemoryCache, SQLiteCache, fingerprint
+
+creds = {}
+creds['username'] = os.environ['OMNITURE_USERNAME']
+creds['secret'] = os.environ['OMNITURE_SECRET']
+test_report_suite = 'omniture.api-gateway'
+
+
+class FileCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.cache = FileCache(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_fingerprint(self):
+        """ Equivalent queries share a key """
+        self.assertEqual(fingerprint('Report', {'a': 1, 'b': [1, 2]}),
+                         fingerprint('Report', {'b': [1, 2], 'a': 1}))
+        self.assertNotEqual(fingerprint('Report', {'a': 1}),
+                            fingerprint('Report', {'a': 2}))
+
+    def test_get_set(self):
+        self.cache.set('key', {'report_suites': []})
+        self.assertEqual(self.cache.get('key'), {'report_suites': []})
+        self.assertIn('key', self.cache)
+        with self.assertRaises(KeyError):
+            self.cache.get('missing')
+
+    def test_atomic_writes(self):
+        """ No temporary files are left behind """
+        self.cache.set('key', [1, 2, 3])
+        self.assertEqual(os.listdir(self.path), ['key.json'])
+
+    def test_ttl(self):
+        self.cache.set('key', 'value', ttl=-1)
+        with self.assertRaises(KeyError):
+            self.cache.get('key')
+        self.assertEqual(os.listdir(self.path), [])
+
+    def test_fetch(self):
+        calls = []
+        compute = lambda: calls.append(1) or 'value'
+        self.assertEqual(self.cache.fetch('key', compute), 'value')
+        self.assertEqual(self.cache.fetch('key', compute), 'value')
+        self.assertEqual(len(calls), 1)
+
+    def test_corrupt_entry(self):
+        with open(os.path.join(self.path, 'key.json'), 'w') as fp:
+            fp.write('{"expires": nu')
+        with self.assertRaises(KeyError):
+            self.cache.get('key')
+
+    def test_lru_entries(self):
+        """ The least recently used entries are evicted first """
+        cache = FileCache(self.path, max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        past = time.time() - 100
+        os.utime(os.path.join(self.path, 'a.json'), (past, past))
+        os.utime(os.path.join(self.path, 'b.json'), (past - 10, past - 10))
+        cache.get('b')
+        cache.set('c', 3)
+        self.assertIn('b', cache)
+        self.assertIn('c', cache)
+        self.assertNotIn('a', cache)
+
+    def test_lru_size(self):
+        cache = FileCache(self.path, max_size=100)
+        cache.set('a', 'x' * 60)
+        cache.set('b', 'x' * 60)
+        self.assertEqual(os.listdir(self.path), ['b.json'])
+
+    def test_clear(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.clear()
+        self.assertEqual(os.listdir(self.path), [])
+
+
+class MemoryCacheTest(unittest.TestCase):
+    def test_same_object(self):
+        """ Values aren't copied or serialized """
+        cache = MemoryCache()
+        value = object()
+        cache.set('key', value)
+        self.assertIs(cache.get('key'), value)
+
+    def test_lru(self):
+        cache = MemoryCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+
+    def test_max_size(self):
+        cache = MemoryCache(max_entries=None, max_size=100, sizeof=len)
+        cache.set('a', 'x' * 60)
+        cache.set('b', 'x' * 60)
+        self.assertNotIn('a', cache)
+        self.assertEqual(cache.size, 60)
+        cache.set('c', 'x' * 200)
+        self.assertNotIn('c', cache)
+        self.assertIn('b', cache)
+
+    def test_growing_values(self):
+        """ Values are measured again as they are used """
+        cache = MemoryCache(max_entries=None, max_size=100, sizeof=len)
+        cache.set('a', ['x'] * 10)
+        cache.set('b', ['x'] * 10)
+        cache.get('a').extend(['x'] * 85)
+        cache.get('a')
+        self.assertEqual(cache.size, 95)
+        self.assertNotIn('b', cache)
+        cache.get('a').extend(['x'] * 10)
+        cache.set('c', ['x'])
+        self.assertEqual(list(cache.entries), ['c'])
+
+    def test_ttl(self):
+        cache = MemoryCache(ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2, ttl=-1)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+
+
+class SQLiteCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.db = os.path.join(self.path, 'cache.db')
+        self.cache = SQLiteCache(self.db, poll_interval=0.01)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_get_set(self):
+        self.cache.set('key', {'report_suites': []})
+        self.assertEqual(self.cache.get('key'), {'report_suites': []})
+        self.assertEqual(SQLiteCache(self.db).get('key'), {'report_suites': []})
+        self.cache.delete('key')
+        self.assertNotIn('key', self.cache)
+
+    def test_ttl(self):
+        self.cache.set('a', 1, ttl=60)
+        self.cache.set('b', 2, ttl=-1)
+        self.assertIn('a', self.cache)
+        self.assertNotIn('b', self.cache)
+
+    def test_lru(self):
+        cache = SQLiteCache(self.db, max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+
+    def test_stale_while_refreshing(self):
+        """ While someone else holds the lease the stale value is served """
+        self.cache.set('key', 'old', ttl=-1)
+        self.assertTrue(self.cache.acquire('key', 'someone else'))
+        self.assertEqual(self.cache.fetch('key', lambda: 'new'), 'old')
+        self.cache.release('key', 'someone else')
+        self.assertEqual(self.cache.fetch('key', lambda: 'new'), 'new')
+
+    def test_abandoned_lease(self):
+        """ Leases of processes that died run out """
+        cache = SQLiteCache(self.db, lease_timeout=-1)
+        self.assertTrue(cache.acquire('key', 'dead'))
+        self.assertTrue(cache.acquire('key', 'alive'))
+
+    def test_single_refresh(self):
+        """ Concurrent fetches of a missing entry compute it once """
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return 'value'
+
+        results = []
+        threads = [threading.Thread(
+            target=lambda: results.append(self.cache.fetch('key', compute)))
+            for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['value'] * 5)
+        self.assertEqual(len(calls), 1)
+
+
+class AccountCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        mocks = os.path.join(os.path.dirname(__file__), 'mock_objects')
+        self.responses = {}
+        for name in ['Company.GetReportSuites', 'Report.GetMetrics',
+                     'Report.GetElements', 'Segments.Get', 'Report.Queue',
+                     'basic_report']:
+            with open(os.path.join(mocks, name + '.json')) as fp:
+                self.responses[name] = fp.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def mock(self, m):
+        for name in ['Company.GetReportSuites', 'Report.GetMetrics',
+                     'Report.GetElements', 'Segments.Get', 'Report.Queue']:
+            m.post('https://api.omniture.com/admin/1.4/rest/?method=' + name,
+                   text=self.responses[name])
+        m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.Get',
+               text=self.responses['basic_report'])
+
+    def authenticate(self):
+        return omniture.authenticate(creds['username'], creds['secret'],
+                                     cache=FileCache(self.path), cache_key='test')
+
+    @requests_mock.mock()
+    def test_metadata_cached(self, m):
+        """ A second account reads suites and metadata from the cache """
+        self.mock(m)
+        first = self.authenticate()
+        first.suites[test_report_suite].metrics
+        first.suites[test_report_suite].elements
+        first.suites[test_report_suite].segments
+        calls = m.call_count
+
+        second = self.authenticate()
+        suite = second.suites[test_report_suite]
+        self.assertEqual(len(suite.metrics), len(first.suites[test_report_suite].metrics))
+        suite.elements
+        suite.segments
+        self.assertEqual(m.call_count, calls)
+
+    @requests_mock.mock()
+    def test_default_cache(self, m):
+        """ The cache made for cache=True doesn't grow forever """
+        self.mock(m)
+        analytics = omniture.authenticate(creds['username'], creds['secret'], cache=True)
+        self.assertIsInstance(analytics.cache, FileCache)
+        self.assertEqual(analytics.cache.ttl, analytics.DEFAULT_CACHE_TTL)
+        self.assertEqual(analytics.cache.max_size, analytics.DEFAULT_CACHE_SIZE)
+
+    @requests_mock.mock()
+    def test_report_cached(self, m):
+        """ Running the same report again doesn't queue it """
+        self.mock(m)
+        suite = self.authenticate().suites[test_report_suite]
+        first = suite.report.metric('pageviews').range('2016-09-04').run(False)
+        calls = m.call_count
+
+        suite = self.authenticate().suites[test_report_suite]
+        second = suite.report.metric('pageviews').range('2016-09-04').run(False)
+        self.assertEqual(first.data, second.data)
+        history = [r.qs['method'][0].lower() for r in m.request_history[calls:]]
+        self.assertNotIn('report.queue', history)
+        self.assertNotIn('report.get', history)
+
+    @requests_mock.mock()
+    def test_report_cache(self, m):
+        """ Identical queries get the finished report from memory """
+        self.mock(m)
+        report_cache = MemoryCache()
+        analytics = omniture.authenticate(creds['username'], creds['secret'],
+                                          report_cache=report_cache)
+        suite = analytics.suites[test_report_suite]
+        first = suite.report.metric('pageviews').range('2016-09-04').run(False)
+        calls = m.call_count
+        second = suite.report.range('2016-09-04').metric('pageviews').run(False)
+        self.assertIs(first, second)
+        self.assertEqual(m.call_count, calls)
+        other = suite.report.metric('pageviews').range('2016-09-05').run(False)
+        self.assertIsNot(first, other)
+
+    @requests_mock.mock()
+    def test_report_size(self, m):
+        """ Reports are measured by their response, and grow as they are used """
+        self.mock(m)
+        analytics = omniture.authenticate(creds['username'], creds['secret'])
+        suite = analytics.suites[test_report_suite]
+        report = suite.report.metric('pageviews').range('2016-09-04').run(False)
+        self.assertEqual(report.raw.size, len(self.responses['basic_report']))
+        size = sys.getsizeof(report)
+        self.assertGreater(size, report.raw.size)
+        # measuring doesn't parse anything
+        self.assertIsNone(report.type_data)
+        report.dataframe
+        self.assertGreater(sys.getsizeof(report), size)
+
+    @requests_mock.mock()
+    def test_current_ttl(self, m):
+        """ Reports that include today are cached for a shorter time """
+        self.mock(m)
+        report_cache = MemoryCache(ttl=3600)
+        analytics = omniture.authenticate(creds['username'], creds['secret'],
+                                          report_cache=report_cache, current_ttl=60)
+        suite = analytics.suites[test_report_suite]
+        old = suite.report.metric('pageviews').range('2016-09-04')
+        today = suite.report.metric('pageviews').range(datetime.date.today())
+        current = old.currentData()
+        for query in [old, today, current]:
+            query.run(False)
+        ttl = lambda query: report_cache.entries[query.cache_key()][1] - time.time()
+        self.assertGreater(ttl(old), 3000)
+        self.assertLess(ttl(today), 61)
+        self.assertLess(ttl(current), 61)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+#!/usr/bin/python
+
+import unittest
+import requests_mock
+import omniture
+import os
+
+creds = {}
+creds['username'] = os.environ['OMNITURE_USERNAME']
+creds['secret'] = os.environ['OMNITURE_SECRET']
+endpoint = 'https://api.omniture.com/admin/1.4/rest/'
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        with requests_mock.mock() as m:
+            path = os.path.dirname(__file__)
+            with open(path+'/mock_objects/Company.GetReportSuites.json') as get_report_suites_file:
+                report_suites = get_report_suites_file.read()
+
+            m.post(endpoint + '?method=Company.GetReportSuites', text=report_suites)
+            self.analytics = omniture.authenticate(creds['username'], creds['secret'],
+                                                   pool_maxsize=4, keep_alive=30)
+
+    def tearDown(self):
+        self.analytics.pool.close()
+        self.analytics = None
+
+    def test_pool_settings(self):
+        """ Make sure the account passes its settings on to the pool """
+        pool = self.analytics.pool
+        self.assertIsInstance(pool, omniture.connection.ConnectionPool)
+        self.assertEqual(pool.pool_maxsize, 4)
+        self.assertEqual(pool.keep_alive, 30)
+        adapter = pool.session.get_adapter(endpoint)
+        self.assertEqual(adapter._pool_maxsize, 4)
+
+    @requests_mock.mock()
+    def test_session_is_reused(self, m):
+        """ Every request made through an account shares one session """
+        m.post(endpoint + '?method=Company.GetEndpoint', text='"{}"'.format(endpoint))
+        session = self.analytics.pool.session
+        self.analytics.request('Company', 'GetEndpoint')
+        self.analytics.suites[0].request('Company', 'GetEndpoint')
+        self.assertIs(self.analytics.pool.session, session)
+        self.assertEqual(self.analytics.pool.in_flight, 0)
+
+    @requests_mock.mock()
+    def test_keep_alive_expiry(self, m):
+        """ Idle connections are dropped once the keep alive runs out """
+        m.post(endpoint + '?method=Company.GetEndpoint', text='"{}"'.format(endpoint))
+        pool = self.analytics.pool
+        session = pool.session
+        pool.last_used -= 60
+        self.analytics.request('Company', 'GetEndpoint')
+        self.assertIsNot(pool.session, session)
+
+    def test_close(self):
+        """ Closing the pool drops the session until the next request """
+        self.analytics.pool.close()
+        self.assertIsNone(self.analytics.pool.session)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,8 @@
 #!/usr/bin/python
 
+import copy
+import pickle
+import threading
 import unittest
 import omniture
 import os
@@ -41,5 +44,67 @@ class ElementTest(unittest.TestCase):
                           "__str__ returned: {}"\
                           .format(self.valueList[0].__str__()))
 
+    def test_extra(self):
+        """ Fields from the API are read as attributes """
+        row = {"id": "pageviews", "name": "Page Views", "type": "number"}
+        value = omniture.elements.Value.list("metrics", [row], "test", "name", "id")[0]
+        self.assertEqual(value.type, "number")
+        self.assertIs(value.extra, row)
+        self.assertFalse(hasattr(value, '__dict__'))
+        with self.assertRaises(AttributeError):
+            value.missing
+
+    def test_own_extra(self):
+        """ Values made without extra fields don't share them """
+        first = omniture.elements.Value("A", "a", "test")
+        second = omniture.elements.Value("B", "b", "test")
+        first.extra['type'] = 'number'
+        self.assertEqual(second.extra, {})
+
+    def test_serialize(self):
+        self.assertEqual(self.valueList[0].serialize(), {'id': '123'})
+
+    def test_pickle(self):
+        for value in [copy.copy(self.valueList[0]),
+                      pickle.loads(pickle.dumps(self.valueList[0], 2))]:
+            self.assertEqual(value.__repr__(), self.valueList[0].__repr__())
+            self.assertEqual(value.title, "ABC")
+
+    def test_lazy(self):
+        """ Values are only created when they are used """
+        rows = [{"id": str(i), "name": "Metric {}".format(i)} for i in range(100)]
+        metrics = omniture.elements.Value.list("metrics", rows, "test", "name", "id")
+        created = lambda: sum(isinstance(item, omniture.elements.Value)
+                              for item in list.__iter__(metrics))
+        self.assertEqual(created(), 0)
+        self.assertEqual(metrics['Metric 42'].id, "42")
+        self.assertIs(metrics['42'], metrics[42])
+        self.assertEqual(metrics[-1].id, "99")
+        self.assertEqual(created(), 2)
+        self.assertEqual([metric.id for metric in metrics[1:3]], ["1", "2"])
+        self.assertEqual([metric.id for metric in metrics], [str(i) for i in range(100)])
+        self.assertEqual(created(), 100)
+
+    def test_lazy_threads(self):
+        """ Threads reading the same rows get the same values """
+        rows = [{"id": str(i), "name": "Metric {}".format(i)} for i in range(1000)]
+        metrics = omniture.elements.Value.list("metrics", rows, "test", "name", "id")
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(list(map(id, metrics))))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 4)
+        for result in results:
+            self.assertEqual(result, list(map(id, metrics)))
+
+    def test_lazy_compare(self):
+        """ Comparing items creates them first """
+        self.assertIn(self.valueList['DEF'], self.valueList)
+        self.assertEqual(self.valueList.index(self.valueList['DEF']), 1)
+        self.assertNotIn(self.valueList[0].copy(), self.valueList)
+
 if __name__ == '__main__':
     unittest.main()
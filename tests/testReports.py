@@ -5,10 +5,21 @@ from __future__ import print_function
 import unittest
 import omniture
 import os
+import json
 from datetime import date
 import pandas
 import datetime
 import requests_mock
+import csv
+import io
+import shutil
+import tempfile
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
 
 
 creds = {}
@@ -170,6 +181,41 @@ class ReportTest(unittest.TestCase):
 
         trended = self.analytics.suites[test_report_suite].report.element("page").metric("pageviews").granularity('hour').run()
         self.assertIsInstance(trended.dataframe, pandas.DataFrame, "Data Frame Object doesn't work")
+        dtypes = trended.dataframe.dtypes
+        self.assertEqual(list(dtypes.index), ['datetime', 'datetime_friendly', 'page', 'pageviews'])
+        self.assertEqual(dtypes['datetime'].kind, 'M')
+        self.assertEqual(dtypes['pageviews'], 'int64')
+        self.assertEqual(dtypes['page'].name, 'category')
+        self.assertEqual(trended.dataframe['page'].tolist(), [row['page'] for row in trended.data])
+
+    @requests_mock.mock()
+    def test_periods(self, m):
+        """ Each period of a trended report is parsed once and shared by its rows """
+        path = os.path.dirname(__file__)
+
+        with open(path+'/mock_objects/trended_report.json') as data_file:
+            json_response = data_file.read()
+
+        with open(path+'/mock_objects/Report.Queue.json') as queue_file:
+            report_queue = queue_file.read()
+
+        m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.Get', text=json_response)
+        m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.Queue', text=report_queue)
+
+        trended = self.analytics.suites[test_report_suite].report.element("page").metric("pageviews").granularity('hour').run()
+        periods = trended._count_columns()['datetime']
+        self.assertIsInstance(periods, omniture.reports.EncodedColumn)
+        self.assertEqual(len(periods.values), 24)
+        self.assertEqual(len(periods), len(trended.columns['pageviews']))
+        datetimes = trended.columns['datetime']
+        self.assertIs(datetimes[0], datetimes[1])
+        self.assertEqual([row['datetime'] for row in trended.data], datetimes)
+        # the columns aren't kept next to the rows
+        self.assertIsNone(trended.column_data)
+        self.assertIsNone(trended.count_data)
+        self.assertEqual(trended.dataframe['datetime'].tolist(), datetimes)
+        self.assertEqual(trended.dataframe['datetime_friendly'].tolist(),
+                         [row['datetime_friendly'] for row in trended.data])
 
     @requests_mock.mock()
     def test_segments_id(self,m):
@@ -250,6 +296,205 @@ class ReportTest(unittest.TestCase):
         self.assertTrue('evar3 | Classification 1' in report.data[0], "The Value of report.data[0] was:{}".format(report.data[0]))
         self.assertTrue('evar5' in report.data[0], "The Value of report.data[0] was:{}".format(report.data[0]))
 
+    @requests_mock.mock()
+    def test_columns(self, m):
+        """ The data is parsed into columns that line up with the rows """
+        path = os.path.dirname(__file__)
+
+        with open(path+'/mock_objects/mixed_classifications.json') as data_file:
+            raw = json.load(data_file)
+        # a top level row without a breakdown
+        leaf = raw['report']['data'][0]
+        del leaf['breakdown']
+
+        with open(path+'/mock_objects/Report.Queue.json') as queue_file:
+            report_queue = queue_file.read()
+
+        m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.Get', text=json.dumps(raw))
+        m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.Queue', text=report_queue)
+
+        report = self.analytics.suites[0].report\
+            .element('evar3',classification="Classification 1", disable_validation=True)\
+            .element('evar5', disable_validation=True)\
+            .run()
+
+        columns = report.columns
+        self.assertEqual(list(columns), ['evar3 | Classification 1', 'evar5', 'f:347467'])
+        self.assertEqual(set(map(len, columns.values())), set([len(report.data)]))
+        self.assertEqual(columns['evar5'][0], None)
+        self.assertEqual(report.data[0], {'evar3 | Classification 1': leaf['name'],
+                                          'f:347467': int(leaf['counts'][0])})
+        self.assertEqual(report.data[1]['evar3 | Classification 1'],
+                         raw['report']['data'][1]['name'])
+
+    @requests_mock.mock()
+    def test_encoded_elements(self, m):
+        """ Element values are kept once each and the rows point to them """
+        path = os.path.dirname(__file__)
+
+        with open(path+'/mock_objects/mixed_classifications.json') as data_file:
+            raw = json.load(data_file)
+        del raw['report']['data'][0]['breakdown']
+
+        with open(path+'/mock_objects/Report.Queue.json') as queue_file:
+            report_queue = queue_file.read()
+
+        m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.Get', text=json.dumps(raw))
+        m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.Queue', text=report_queue)
+
+        report = self.analytics.suites[0].report\
+            .element('evar3',classification="Classification 1", disable_validation=True)\
+            .element('evar5', disable_validation=True)\
+            .run()
+
+        encoded = report._count_columns()['evar5']
+        self.assertIsInstance(encoded, omniture.reports.EncodedColumn)
+        self.assertEqual(len(encoded.values), len(set(encoded.values)))
+        self.assertEqual(encoded.codes[0], -1)
+        values = [row.get('evar5') for row in report.data]
+        self.assertEqual(len(set(map(id, values))), len(encoded.values) + 1)
+        frame = report.dataframe
+        self.assertEqual(frame['evar5'].dtype.name, 'category')
+        self.assertTrue(pandas.isnull(frame['evar5'][0]))
+        self.assertEqual(frame['evar5'].tolist()[1:], values[1:])
+
+    @requests_mock.mock()
+    def test_metric_types(self, m):
+        """ A metric has a single type, whether rows are streamed or not """
+        path = os.path.dirname(__file__)
+
+        with open(path+'/mock_objects/ranked_report.json') as data_file:
+            raw = json.load(data_file)
+        raw['report']['data'][1]['counts'][1] = '2.5'
+
+        with open(path+'/mock_objects/Report.Queue.json') as queue_file:
+            report_queue = queue_file.read()
+
+        m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.Get', text=json.dumps(raw))
+        m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.Queue', text=report_queue)
+
+        report = self.analytics.suites[test_report_suite].report.element("page").metric("pageviews").metric("visits").run()
+        self.assertEqual(list(report.metric_types.values()), [int, float])
+        self.assertEqual(set(type(row['pageviews']) for row in report), set([int]))
+        self.assertEqual(set(type(row['visits']) for row in report), set([float]))
+        self.assertEqual(set(map(type, report.columns['pageviews'])), set([int]))
+        self.assertEqual(set(map(type, report.columns['visits'])), set([float]))
+        self.assertEqual(report.dataframe['pageviews'].dtype, 'int64')
+        self.assertEqual(report.dataframe['visits'].dtype, 'float64')
+        self.assertEqual(report.dataframe['visits'][1], 2.5)
+
+    @requests_mock.mock()
+    def test_null_count(self, m):
+        """ Rows with a null count can be streamed and written """
+        path = os.path.dirname(__file__)
+
+        with open(path+'/mock_objects/ranked_report.json') as data_file:
+            raw = json.load(data_file)
+        raw['report']['data'][1]['counts'][1] = None
+
+        with open(path+'/mock_objects/Report.Queue.json') as queue_file:
+            report_queue = queue_file.read()
+
+        m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.Get', text=json.dumps(raw))
+        m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.Queue', text=report_queue)
+
+        report = self.analytics.suites[test_report_suite].report.element("page").metric("pageviews").metric("visits").run()
+        rows = list(report.iter_rows())
+        self.assertNotIn('visits', rows[1])
+        self.assertEqual([row.get('visits') for row in rows], report.columns['visits'])
+        fp = io.StringIO() if str is not bytes else io.BytesIO()
+        self.assertEqual(report.write_csv(fp), len(rows))
+        line = fp.getvalue().splitlines()[2]
+        self.assertTrue(line.endswith(','))
+
+    @requests_mock.mock()
+    def test_iter_rows(self, m):
+        """ Rows can be streamed without building report.data """
+        path = os.path.dirname(__file__)
+
+        with open(path+'/mock_objects/trended_report.json') as data_file:
+            json_response = data_file.read()
+
+        with open(path+'/mock_objects/Report.Queue.json') as queue_file:
+            report_queue = queue_file.read()
+
+        m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.Get', text=json_response)
+        m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.Queue', text=report_queue)
+
+        trended = self.analytics.suites[test_report_suite].report.element("page").metric("pageviews").granularity('hour').run()
+        rows = list(trended)
+        self.assertIsNone(trended.dict_data)
+        self.assertIsNone(trended.column_data)
+        self.assertEqual(rows, trended.data)
+        self.assertEqual(next(trended.iter_rows(columns=['page', 'pageviews'])),
+                         {'page': rows[0]['page'], 'pageviews': rows[0]['pageviews']})
+        with self.assertRaises(KeyError):
+            next(trended.iter_rows(columns=['visits']))
+
+    @requests_mock.mock()
+    def test_write(self, m):
+        """ Rows are streamed to CSV and JSON lines in a stable order """
+        path = os.path.dirname(__file__)
+
+        with open(path+'/mock_objects/trended_report.json') as data_file:
+            json_response = data_file.read()
+
+        with open(path+'/mock_objects/Report.Queue.json') as queue_file:
+            report_queue = queue_file.read()
+
+        m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.Get', text=json_response)
+        m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.Queue', text=report_queue)
+
+        query = self.analytics.suites[test_report_suite].report.element("page").metric("pageviews").granularity('hour')
+        fp = io.StringIO() if str is not bytes else io.BytesIO()
+        count = query.write_csv(fp)
+        rows = list(csv.reader(io.StringIO(fp.getvalue()) if str is not bytes else io.BytesIO(fp.getvalue())))
+        self.assertEqual(rows[0], ['datetime', 'datetime_friendly', 'page', 'pageviews'])
+        self.assertEqual(count, len(rows) - 1)
+
+        report = query.processed_response
+        self.assertIsNone(report.dict_data)
+        self.assertEqual(rows[1][2:], [report.data[0]['page'], str(report.data[0]['pageviews'])])
+
+        fp = io.StringIO() if str is not bytes else io.BytesIO()
+        self.assertEqual(report.write_jsonl(fp), count)
+        lines = fp.getvalue().splitlines()
+        first = json.loads(lines[0])
+        self.assertEqual(first['datetime'], report.data[0]['datetime'].isoformat())
+        self.assertEqual(first['pageviews'], report.data[0]['pageviews'])
+        self.assertEqual(len(lines), count)
+
+    @unittest.skipIf(pyarrow is None, "pyarrow isn't installed")
+    @requests_mock.mock()
+    def test_arrow(self, m):
+        """ Reports convert to typed Arrow tables and Parquet files """
+        path = os.path.dirname(__file__)
+
+        with open(path+'/mock_objects/trended_report.json') as data_file:
+            json_response = data_file.read()
+
+        with open(path+'/mock_objects/Report.Queue.json') as queue_file:
+            report_queue = queue_file.read()
+
+        m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.Get', text=json_response)
+        m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.Queue', text=report_queue)
+
+        trended = self.analytics.suites[test_report_suite].report.element("page").metric("pageviews").granularity('hour').run()
+        table = trended.to_arrow()
+        self.assertEqual(table.column_names, ['datetime', 'datetime_friendly', 'page', 'pageviews'])
+        self.assertEqual(table.num_rows, len(trended.data))
+        self.assertTrue(pyarrow.types.is_timestamp(table.schema.field('datetime').type))
+        self.assertTrue(pyarrow.types.is_dictionary(table.schema.field('page').type))
+        self.assertEqual(table.schema.field('pageviews').type, pyarrow.int64())
+
+        directory = tempfile.mkdtemp()
+        try:
+            trended.to_parquet(os.path.join(directory, 'report.parquet'))
+            written = pyarrow.parquet.read_table(os.path.join(directory, 'report.parquet'))
+            self.assertEqual(written.column('page').to_pylist(), [row['page'] for row in trended.data])
+        finally:
+            shutil.rmtree(directory)
+
     @requests_mock.mock()
     def test_repr_html_(self,m):
         """Test the _repr_html_ method used by iPython for notebook display"""
@@ -0,0 +1,174 @@
+#!/usr/bin/python
+
+import unittest
+import requests
+import requests_mock
+import omniture
+import os
+
+creds = {}
+creds['username'] = os.environ['OMNITURE_USERNAME']
+creds['secret'] = os.environ['OMNITURE_SECRET']
+test_report_suite = 'omniture.api-gateway'
+endpoint = 'https://api.omniture.com/admin/1.4/rest/'
+
+
+class RetryTest(unittest.TestCase):
+    def setUp(self):
+        path = os.path.dirname(__file__)
+        with open(path+'/mock_objects/Company.GetReportSuites.json') as get_report_suites_file:
+            self.report_suites = get_report_suites_file.read()
+
+        with open(path+'/mock_objects/invalid_metric.json') as invalid_file:
+            self.invalid = invalid_file.read()
+
+        with open(path+'/mock_objects/basic_report.json') as data_file:
+            self.report = data_file.read()
+
+        with open(path+'/mock_objects/Report.Queue.json') as queue_file:
+            self.report_queue = queue_file.read()
+
+        with requests_mock.mock() as m:
+            m.post(endpoint + '?method=Company.GetReportSuites', text=self.report_suites)
+            self.analytics = omniture.authenticate(
+                creds['username'], creds['secret'],
+                retry=omniture.retry.RetryPolicy(retries=2, backoff=0),
+                circuit_breaker=omniture.retry.CircuitBreaker(threshold=4, reset_timeout=60))
+
+    def tearDown(self):
+        self.analytics = None
+
+    @requests_mock.mock()
+    def test_server_error_retried(self, m):
+        """ 5xx responses are retried """
+        m.post(endpoint + '?method=Company.GetReportSuites', [
+            {'status_code': 503, 'text': 'Service Unavailable'},
+            {'text': self.report_suites}])
+        response = self.analytics.request('Company', 'GetReportSuites')
+        self.assertIn('report_suites', response)
+        self.assertEqual(m.call_count, 2)
+
+    @requests_mock.mock()
+    def test_bad_json_retried(self, m):
+        """ Responses that aren't JSON are retried """
+        m.post(endpoint + '?method=Company.GetReportSuites', [
+            {'text': '<html>oops</html>'},
+            {'text': self.report_suites}])
+        response = self.analytics.request('Company', 'GetReportSuites')
+        self.assertIn('report_suites', response)
+
+    @requests_mock.mock()
+    def test_give_up(self, m):
+        """ After the last retry the failure surfaces as a TransientError """
+        m.post(endpoint + '?method=Company.GetReportSuites', status_code=500, text='error')
+        with self.assertRaises(omniture.retry.TransientError):
+            self.analytics.request('Company', 'GetReportSuites')
+        self.assertEqual(m.call_count, 3)
+
+    @requests_mock.mock()
+    def test_invalid_report_not_retried(self, m):
+        """ Errors reported by the API are not retried """
+        m.post(endpoint + '?method=Report.Queue', status_code=400, text=self.invalid)
+        with self.assertRaises(omniture.reports.InvalidReportError):
+            self.analytics.request('Report', 'Queue', {})
+        self.assertEqual(m.call_count, 1)
+
+    @requests_mock.mock()
+    def test_queue_not_retried(self, m):
+        """ Reports aren't queued again after the API may have seen them """
+        for response in [{'status_code': 503, 'text': 'Service Unavailable'},
+                         {'exc': requests.exceptions.ReadTimeout}]:
+            m.post(endpoint + '?method=Report.Queue',
+                   [response, {'text': self.report_queue}])
+            with self.assertRaises(omniture.retry.TransientError):
+                self.analytics.request('Report', 'Queue', {})
+            self.assertEqual(m.call_count, 1)
+            m.reset_mock()
+
+    @requests_mock.mock()
+    def test_queue_retried_when_unsent(self, m):
+        """ Failing to connect is retried for every method """
+        m.post(endpoint + '?method=Report.Queue', [
+            {'exc': requests.exceptions.ConnectTimeout},
+            {'text': self.report_queue}])
+        response = self.analytics.request('Report', 'Queue', {})
+        self.assertEqual(response['reportID'], '123456789')
+        self.assertEqual(m.call_count, 2)
+
+    @requests_mock.mock()
+    def test_circuit_breaker(self, m):
+        """ Once the API keeps failing requests fail fast """
+        m.post(endpoint + '?method=Company.GetReportSuites', status_code=502, text='error')
+        with self.assertRaises(omniture.retry.TransientError):
+            self.analytics.request('Company', 'GetReportSuites')
+        with self.assertRaises(omniture.retry.CircuitOpenError):
+            self.analytics.request('Company', 'GetReportSuites')
+        self.assertEqual(self.analytics.circuit_breaker.state, "open")
+        self.assertEqual(m.call_count, 4)
+
+    @requests_mock.mock()
+    def test_circuit_closes(self, m):
+        """ A successful trial request closes the circuit """
+        m.post(endpoint + '?method=Company.GetReportSuites', text=self.report_suites)
+        breaker = self.analytics.circuit_breaker
+        for i in range(4):
+            breaker.failure()
+        self.assertEqual(breaker.state, "open")
+        breaker.opened -= 61
+        self.analytics.request('Company', 'GetReportSuites')
+        self.assertEqual(breaker.state, "closed")
+
+    @requests_mock.mock()
+    def test_trial_always_ends(self, m):
+        """ A trial request that fails for another reason doesn't keep the
+        circuit half-open """
+        m.post(endpoint + '?method=Company.GetReportSuites', [
+            {'exc': requests.exceptions.TooManyRedirects},
+            {'text': self.report_suites}])
+        breaker = self.analytics.circuit_breaker
+        for i in range(4):
+            breaker.failure()
+        breaker.opened -= 61
+        with self.assertRaises(requests.exceptions.TooManyRedirects):
+            self.analytics.request('Company', 'GetReportSuites')
+        self.assertEqual(breaker.state, "open")
+        self.analytics.request('Company', 'GetReportSuites')
+        self.assertEqual(breaker.state, "closed")
+
+    @requests_mock.mock()
+    def test_connection_reset_retried(self, m):
+        """ Connections reset while reading the response are retried """
+        m.post(endpoint + '?method=Company.GetReportSuites', [
+            {'exc': requests.exceptions.ChunkedEncodingError},
+            {'text': self.report_suites}])
+        response = self.analytics.request('Company', 'GetReportSuites')
+        self.assertIn('report_suites', response)
+        self.assertEqual(m.call_count, 2)
+
+    @requests_mock.mock()
+    def test_probe_keeps_report(self, m):
+        """ Polling carries on through transient failures """
+        m.post(endpoint + '?method=Report.Queue', text=self.report_queue)
+        m.post(endpoint + '?method=Report.Get', [
+            {'status_code': 500, 'text': 'error'},
+            {'status_code': 500, 'text': 'error'},
+            {'status_code': 500, 'text': 'error'},
+            {'text': self.report}])
+        query = self.analytics.suites[test_report_suite].report\
+            .metric('pageviews', disable_validation=True)
+        report = query.sync(interval=0.01)
+        self.assertIsInstance(report, omniture.reports.Report)
+        self.assertEqual(query.id, "123456789")
+
+    def test_jitter(self):
+        """ Delays grow with every attempt and never pass the maximum """
+        policy = omniture.retry.RetryPolicy(backoff=1, max_backoff=4, jitter=False)
+        self.assertEqual([policy.delay(i) for i in range(4)], [1, 2, 4, 4])
+        policy = omniture.retry.RetryPolicy(backoff=1, max_backoff=4)
+        for i in range(10):
+            self.assertLessEqual(policy.delay(i), 4)
+            self.assertGreaterEqual(policy.delay(i), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+#!/usr/bin/python
+
+import unittest
+import requests_mock
+import omniture
+import os
+import json
+
+creds = {}
+creds['username'] = os.environ['OMNITURE_USERNAME']
+creds['secret'] = os.environ['OMNITURE_SECRET']
+test_report_suite = 'omniture.api-gateway'
+
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        with requests_mock.mock() as m:
+            path = os.path.dirname(__file__)
+            #read in mock response for Company.GetReportSuites to make tests faster
+            with open(path+'/mock_objects/Company.GetReportSuites.json') as get_report_suites_file:
+                report_suites = get_report_suites_file.read()
+
+            with open(path+'/mock_objects/Report.GetMetrics.json') as get_metrics_file:
+                metrics = get_metrics_file.read()
+
+            with open(path+'/mock_objects/Report.GetElements.json') as get_elements_file:
+                elements = get_elements_file.read()
+
+            #setup mock responses
+            m.post('https://api.omniture.com/admin/1.4/rest/?method=Company.GetReportSuites', text=report_suites)
+            m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.GetMetrics', text=metrics)
+            m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.GetElements', text=elements)
+
+            self.analytics = omniture.authenticate(creds['username'], creds['secret'])
+            self.analytics.suites[test_report_suite].metrics
+            self.analytics.suites[test_report_suite].elements
+
+        with open(path+'/mock_objects/basic_report.json') as data_file:
+            self.report = data_file.read()
+
+        with open(path+'/mock_objects/Report.Get.NotReady.json') as data_file:
+            self.not_ready = data_file.read()
+
+        self.report_ids = iter(range(1, 100))
+        # how many times each report id reports not ready before it's done
+        self.pending = {1: 2, 2: 0, 3: 1}
+        self.polls = []
+
+    def tearDown(self):
+        self.analytics = None
+
+    def queue_callback(self, request, context):
+        return json.dumps({"reportID": next(self.report_ids)})
+
+    def get_callback(self, request, context):
+        report_id = request.json()['reportID']
+        self.polls.append(report_id)
+        if self.pending[report_id] > 0:
+            self.pending[report_id] -= 1
+            return self.not_ready
+        return self.report
+
+    def mock(self, m):
+        m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.Queue', text=self.queue_callback)
+        m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.Get', text=self.get_callback)
+
+    def queries(self):
+        suite = self.analytics.suites[test_report_suite]
+        return [suite.report.metric('pageviews') for i in range(3)]
+
+    @requests_mock.mock()
+    def test_as_completed(self, m):
+        """ Reports come out in the order they finish, not the order they were queued """
+        self.mock(m)
+        results = list(omniture.as_completed(self.queries(), interval=0.01))
+        self.assertEqual([key for key, report in results], [1, 2, 0])
+        for key, report in results:
+            self.assertIsInstance(report, omniture.reports.Report)
+
+    @requests_mock.mock()
+    def test_interleaved_polling(self, m):
+        """ Pending reports are polled together instead of one after the other """
+        self.mock(m)
+        omniture.sync(self.queries(), interval=0.01)
+        self.assertEqual(self.polls, [1, 2, 3, 1, 3, 1])
+
+    @requests_mock.mock()
+    def test_sync_list(self, m):
+        """ sync keeps the order of a list of queries """
+        self.mock(m)
+        queries = self.queries()
+        response = omniture.sync(queries, interval=0.01)
+        self.assertIsInstance(response, list)
+        self.assertEqual(len(response), 3)
+        for query, report in zip(queries, response):
+            self.assertIs(query.processed_response, report)
+
+    @requests_mock.mock()
+    def test_sync_dict(self, m):
+        """ sync keeps the keys of a dictionary of queries """
+        self.mock(m)
+        queries = dict(zip(['a', 'b', 'c'], self.queries()))
+        response = omniture.sync(queries, interval=0.01)
+        self.assertEqual(sorted(response.keys()), ['a', 'b', 'c'])
+        for key, query in queries.items():
+            self.assertIs(query.processed_response, response[key])
+
+    @requests_mock.mock()
+    def test_already_queued(self, m):
+        """ Queries that were queued before are not queued again """
+        self.mock(m)
+        queries = self.queries()
+        queries[0].queue()
+        omniture.sync(queries, interval=0.01)
+        self.assertEqual(m.call_count - len(self.polls), 3)
+
+    def get_queue_callback(self, request, context):
+        self.queue_checks += 1
+        queued = [report_id for report_id, polls in self.pending.items() if polls > 0]
+        for report_id in queued:
+            self.pending[report_id] -= 1
+        return json.dumps([{"reportID": report_id, "status": "waiting"} for report_id in queued])
+
+    @requests_mock.mock()
+    def test_bulk(self, m):
+        """ In bulk mode the queue is checked once per tick and reports are
+        only fetched after they leave it """
+        self.mock(m)
+        self.queue_checks = 0
+        m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.GetQueue', text=self.get_queue_callback)
+        results = list(omniture.as_completed(self.queries(), interval=0.01, bulk=True))
+        self.assertEqual([key for key, report in results], [1, 2, 0])
+        self.assertEqual(sorted(self.polls), [1, 2, 3])
+        self.assertEqual(self.queue_checks, 3)
+
+    @requests_mock.mock()
+    def test_queued_reports(self, m):
+        """ The account lists the ids of queued reports """
+        path = os.path.dirname(__file__)
+        with open(path+'/mock_objects/Report.GetQueue.json') as queue_file:
+            m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.GetQueue', text=queue_file.read())
+        self.assertEqual(self.analytics.queued_reports(), set(['123456789']))
+
+    def test_bad_input(self):
+        """ Only lists and dictionaries of queries are accepted """
+        with self.assertRaises(ValueError):
+            omniture.sync("not a query")
+
+
+if __name__ == '__main__':
+    unittest.main()
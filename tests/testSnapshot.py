@@ -0,0 +1,67 @@
+#!/usr/bin/python
+
+import unittest
+import requests_mock
+import omniture
+import os
+import shutil
+import tempfile
+
+creds = {}
+creds['username'] = os.environ['OMNITURE_USERNAME']
+creds['secret'] = os.environ['OMNITURE_SECRET']
+test_report_suite = 'omniture.api-gateway'
+
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        mocks = os.path.join(os.path.dirname(__file__), 'mock_objects')
+        with requests_mock.mock() as m:
+            for name in ['Company.GetReportSuites', 'Report.GetMetrics',
+                         'Report.GetElements', 'Segments.Get']:
+                with open(os.path.join(mocks, name + '.json')) as fp:
+                    m.post('https://api.omniture.com/admin/1.4/rest/?method=' + name,
+                           text=fp.read())
+            self.analytics = omniture.authenticate(creds['username'], creds['secret'])
+            self.suite = self.analytics.suites[test_report_suite]
+            self.snapshot = os.path.join(self.path, 'metadata.json.gz')
+            self.analytics.save_snapshot(self.snapshot, [self.suite])
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    @requests_mock.mock()
+    def test_offline(self, m):
+        """ An account made from a snapshot makes no requests """
+        analytics = omniture.authenticate(creds['username'], creds['secret'],
+                                          snapshot=self.snapshot)
+        suite = analytics.suites[test_report_suite]
+        self.assertEqual(len(analytics.suites), 1)
+        self.assertEqual(suite.title, self.suite.title)
+        self.assertEqual([metric.id for metric in suite.metrics],
+                         [metric.id for metric in self.suite.metrics])
+        self.assertEqual(len(suite.elements), len(self.suite.elements))
+        self.assertEqual(len(suite.segments), len(self.suite.segments))
+        suite.report.metric('pageviews').element('page')
+        self.assertEqual(m.call_count, 0)
+
+    def test_uncompressed(self):
+        path = os.path.join(self.path, 'metadata.json')
+        self.analytics.save_snapshot(path, [self.suite])
+        with open(path) as fp:
+            self.assertTrue(fp.read().startswith('{'))
+        analytics = omniture.authenticate(creds['username'], creds['secret'],
+                                          snapshot=path)
+        self.assertEqual(analytics.suites[test_report_suite].raw, self.suite.raw)
+
+    def test_bad_snapshot(self):
+        path = os.path.join(self.path, 'metadata.json')
+        with open(path, 'w') as fp:
+            fp.write('{"version": 0}')
+        with self.assertRaises(omniture.snapshot.SnapshotError):
+            self.analytics.load_snapshot(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+#!/usr/bin/python
+
+import unittest
+import requests_mock
+import omniture
+import os
+import json
+import time
+
+creds = {}
+creds['username'] = os.environ['OMNITURE_USERNAME']
+creds['secret'] = os.environ['OMNITURE_SECRET']
+test_report_suite = 'omniture.api-gateway'
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_burst(self):
+        """ A full bucket lets a burst through without waiting """
+        bucket = omniture.throttle.TokenBucket(1, burst=5)
+        start = time.time()
+        for i in range(5):
+            bucket.acquire()
+        self.assertLess(time.time() - start, 0.5)
+
+    def test_rate(self):
+        """ Once the bucket is empty requests go out at the rate limit """
+        bucket = omniture.throttle.TokenBucket(50, burst=1)
+        start = time.time()
+        for i in range(6):
+            bucket.acquire()
+        self.assertGreaterEqual(time.time() - start, 0.09)
+
+
+class QueueGovernorTest(unittest.TestCase):
+    def setUp(self):
+        with requests_mock.mock() as m:
+            path = os.path.dirname(__file__)
+            with open(path+'/mock_objects/Company.GetReportSuites.json') as get_report_suites_file:
+                report_suites = get_report_suites_file.read()
+
+            m.post('https://api.omniture.com/admin/1.4/rest/?method=Company.GetReportSuites', text=report_suites)
+            self.report_suites = report_suites
+            self.analytics = omniture.authenticate(creds['username'], creds['secret'],
+                                                   rate_limit=100, max_queued=2)
+
+        with open(path+'/mock_objects/basic_report.json') as data_file:
+            self.report = data_file.read()
+
+        self.report_ids = iter(range(1, 100))
+        self.in_queue = set()
+        self.most_in_queue = 0
+
+    def tearDown(self):
+        self.analytics = None
+
+    def queue_callback(self, request, context):
+        report_id = next(self.report_ids)
+        self.in_queue.add(report_id)
+        self.most_in_queue = max(self.most_in_queue, len(self.in_queue))
+        return json.dumps({"reportID": report_id})
+
+    def get_callback(self, request, context):
+        self.in_queue.discard(request.json()['reportID'])
+        return self.report
+
+    def mock(self, m):
+        m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.Queue', text=self.queue_callback)
+        m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.Get', text=self.get_callback)
+        m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.CancelReport', text='true')
+
+    def queries(self, count):
+        suite = self.analytics.suites[test_report_suite]
+        return [suite.report.metric('pageviews', disable_validation=True) for i in range(count)]
+
+    def test_account_settings(self):
+        self.assertEqual(self.analytics.limiter.rate, 100)
+        self.assertEqual(self.analytics.governor.limit, 2)
+
+    @requests_mock.mock()
+    def test_queue_full(self, m):
+        """ Queueing without blocking fails once every slot is taken """
+        self.mock(m)
+        first, second, third = self.queries(3)
+        first.queue()
+        second.queue()
+        with self.assertRaises(omniture.throttle.QueueFullError):
+            third.queue(block=False)
+        self.assertEqual(third.status, "Not Submitted")
+
+    @requests_mock.mock()
+    def test_slots_released(self, m):
+        """ Finished and cancelled reports hand their slot back """
+        self.mock(m)
+        first, second, third = self.queries(3)
+        first.queue()
+        second.queue()
+        self.assertTrue(first.is_ready())
+        second.cancel()
+        third.queue(block=False)
+        self.assertFalse(first.slot)
+        self.assertFalse(second.slot)
+        self.assertTrue(third.slot)
+
+    @requests_mock.mock()
+    def test_sync_respects_limit(self, m):
+        """ sync never has more reports in the queue than allowed """
+        self.mock(m)
+        response = omniture.sync(self.queries(5), interval=0.01)
+        self.assertEqual(len(response), 5)
+        self.assertEqual(self.most_in_queue, 2)
+        for report in response:
+            self.assertIsInstance(report, omniture.reports.Report)
+
+    @requests_mock.mock()
+    def test_queue_then_sync(self, m):
+        """ omniture.queue leaves reports that don't fit to omniture.sync """
+        self.mock(m)
+        queries = self.queries(3)
+        omniture.queue(queries)
+        self.assertEqual([query.status for query in queries],
+                         ["Not Ready", "Not Ready", "Not Submitted"])
+        response = omniture.sync(queries, interval=0.01)
+        self.assertEqual(len(response), 3)
+        self.assertEqual(self.most_in_queue, 2)
+
+    @requests_mock.mock()
+    def test_backlog_per_account(self, m):
+        """ An account with a full queue doesn't hold up other accounts """
+        self.mock(m)
+        m.post('https://api.omniture.com/admin/1.4/rest/?method=Company.GetReportSuites',
+               text=self.report_suites)
+        other = omniture.authenticate(creds['username'], creds['secret'], max_queued=2)
+        first, second, third = self.queries(3)
+        fourth = other.suites[test_report_suite].report.metric('pageviews', disable_validation=True)
+        scheduler = omniture.scheduler.Scheduler([first, second, third, fourth])
+        scheduler.backlog(scheduler.queries)
+        scheduler.queue()
+        self.assertEqual(third.status, "Not Submitted")
+        self.assertEqual(fourth.status, "Not Ready")
+        self.assertEqual(scheduler.pending(), 4)
+
+    @requests_mock.mock()
+    def test_slots_released_on_error(self, m):
+        """ Reports nobody waits on anymore hand their slot back """
+        self.mock(m)
+        m.post('https://api.omniture.com/admin/1.4/rest/?method=Report.Get', text='{"report": {}}')
+        query = self.queries(1)[0]
+        with self.assertRaises(KeyError):
+            query.sync()
+        self.assertFalse(query.slot)
+        queries = self.queries(2)
+        with self.assertRaises(KeyError):
+            omniture.sync(queries, interval=0.01)
+        self.assertEqual([query.slot for query in queries], [False, False])
+        for query in self.queries(2):
+            query.queue(block=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,12 @@
+import copy
 import datetime
+import pickle
+import threading
+import time
 
 import unittest
 import omniture
+from omniture.elements import Value
 
 
 
@@ -85,3 +90,101 @@ class UtilsTest(unittest.TestCase):
         self.assertEqual(omniture.utils.translate(t,m),s)
     
         
+
+
+class AddressableListTest(unittest.TestCase):
+    def setUp(self):
+        fakelist = [{"id":"123", "title":"abc"},{"id":"456","title":"abc"}]
+        self.alist = Value.list("segments", fakelist, {})
+
+    def test_addressable_list_lookup(self):
+        """ Items are found by id or title, and by position """
+        self.assertEqual(self.alist['123'].id, '123')
+        self.assertIs(self.alist[1], self.alist['456'])
+        self.assertEqual([item.id for item in self.alist[:1]], ['123'])
+        with self.assertRaises(KeyError):
+            self.alist['789']
+        with self.assertRaises(KeyError):
+            self.alist[{}]
+
+    def test_addressable_list_mutation(self):
+        """ The index follows changes to the list """
+        self.alist['123']
+        self.alist.append(Value('def', '789', {}))
+        self.assertEqual(self.alist['def'].id, '789')
+        del self.alist[0]
+        self.assertEqual(self.alist['abc'].id, '456')
+        with self.assertRaises(KeyError):
+            self.alist['123']
+        self.alist.insert(0, Value('ghi', '123', {}))
+        self.assertEqual(self.alist['123'].title, 'ghi')
+        self.alist.sort(key=lambda item: item.id, reverse=True)
+        self.assertIs(self.alist[0], self.alist['789'])
+
+    def test_addressable_list_copy(self):
+        """ Copies don't share the index """
+        self.alist['123']
+        for other in [copy.copy(self.alist), copy.deepcopy(self.alist),
+                      pickle.loads(pickle.dumps(self.alist))]:
+            other.append(Value('def', '789', {}))
+            self.assertEqual(other['def'].id, '789')
+            with self.assertRaises(KeyError):
+                self.alist['def']
+        self.assertEqual(self.alist['123'].title, 'abc')
+
+
+class SingleFlightTest(unittest.TestCase):
+    def setUp(self):
+        self.calls = 0
+        self.release = threading.Event()
+        self.flight = omniture.utils.SingleFlight()
+
+    def slow(self, value):
+        self.calls += 1
+        self.release.wait(5)
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    def run_threads(self, count, key, value):
+        results = []
+        errors = []
+
+        def call():
+            try:
+                results.append(self.flight.do(key, self.slow, value))
+            except ValueError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        while key not in self.flight.calls:
+            time.sleep(0.001)
+        time.sleep(0.05)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        return results, errors
+
+    def test_coalesce(self):
+        """ Concurrent calls with the same key run the function once """
+        results, errors = self.run_threads(5, 'key', {'data': 1})
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(len(results), 5)
+        for result in results:
+            self.assertIs(result, results[0])
+        self.assertEqual(self.flight.calls, {})
+
+    def test_shared_exception(self):
+        """ Everyone waiting on a call that fails gets the exception """
+        results, errors = self.run_threads(3, 'key', ValueError('boom'))
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(len(errors), 3)
+
+    def test_sequential_calls(self):
+        """ Calls that don't overlap aren't coalesced """
+        self.release.set()
+        self.flight.do('key', self.slow, 1)
+        self.flight.do('key', self.slow, 1)
+        self.assertEqual(self.calls, 2)